@@ -1509,9 +1509,10 @@ class Device(metro.WidgetDevice, metro.DisplayDevice):
         self.labelTotalLinks = widgets.ChannelLinksLabel()
         self.labelTotalLinks.setContextMenu(self.menuChannelLink)
         self.labelTotalLinks.setStyleSheet('color: white;')
-        self.labelTotalLinks.addChannel(self.ch_mtx, 'matrix')
-        self.labelTotalLinks.addChannel(self.ch_xspec, 'x')
-        self.labelTotalLinks.addChannel(self.ch_yspec, 'y')
+        with self.labelTotalLinks.batched():
+            self.labelTotalLinks.addChannel(self.ch_mtx, 'matrix')
+            self.labelTotalLinks.addChannel(self.ch_xspec, 'x')
+            self.labelTotalLinks.addChannel(self.ch_yspec, 'y')
 
         self.layoutInfo = QtWidgets.QGridLayout()
         self.layoutInfo.setSizeConstraint(QtWidgets.QLayout.SetFixedSize)
@@ -1805,10 +1806,11 @@ class Device(metro.WidgetDevice, metro.DisplayDevice):
         labelLinks = widgets.ChannelLinksLabel()
         labelLinks.setContextMenu(self.menuChannelLink)
         labelLinks.setStyleSheet('color: white;')
-        labelLinks.addChannel(rate_channel, 'rate')
-        labelLinks.addChannel(counts_channel, 'counts')
-        labelLinks.addChannel(xspec_channel, 'x')
-        labelLinks.addChannel(yspec_channel, 'y')
+        with labelLinks.batched():
+            labelLinks.addChannel(rate_channel, 'rate')
+            labelLinks.addChannel(counts_channel, 'counts')
+            labelLinks.addChannel(xspec_channel, 'x')
+            labelLinks.addChannel(yspec_channel, 'y')
 
         row_idx = self.layoutInfo.rowCount()
         self.layoutInfo.addWidget(labelName, row_idx, 1,
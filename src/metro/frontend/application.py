@@ -272,8 +272,6 @@ class AbstractApplication(object):
         display_arguments = {}
 
         with open(state['path'], 'r') as fp:
-            cur_offset = 0
-
             # First we read in the header
             for line in fp:
                 if line.startswith('# DISPLAY'):
@@ -291,11 +289,8 @@ class AbstractApplication(object):
                     display_arguments[key] = value
 
                 elif not line.startswith('#'):
-                    body_offset = cur_offset
                     break
 
-                cur_offset += len(line)
-
         try:
             chan = metro.NumericChannel(
                 name, hint=state['hint'], freq=state['freq'],
@@ -310,7 +305,7 @@ class AbstractApplication(object):
         chan._replayed_path = state['path']
 
         loader = ReplayStreamChannelDialog.MetroFileLoader(
-            state['path'], state['shape'], body_offset
+            state['path'], state['shape']
         )
 
         loader.finished.connect(metro.QSlot()(
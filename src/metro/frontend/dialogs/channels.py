@@ -4,6 +4,7 @@
 # file, You can obtain one at https://mozilla.org/MPL/2.0/.
 
 
+import functools
 import time
 
 import numpy  # noqa
@@ -15,6 +16,16 @@ import metro
 from metro.frontend import widgets
 
 
+@functools.lru_cache(maxsize=None)
+def _loadUiType(ui_name):
+    # Compiles a UI file of this package into a form class only once
+    # instead of parsing it again for every dialog instance.
+    form_class, _ = QtUic.loadUiType(metro.resource_filename(
+        __name__, ui_name))
+
+    return form_class
+
+
 class EditNormalizedChannelDialog(QtWidgets.QDialog):
     def __init__(self, channel=None):
         super().__init__()
@@ -819,37 +830,39 @@ class EditScriptedChannelDialog(QtWidgets.QDialog):
                     return
 
 
-class SelectChannelDialog(QtWidgets.QDialog):
+class SelectChannelDialog(QtWidgets.QDialog,
+                          _loadUiType('channels_select.ui')):
     def __init__(self, selected_channel, excluded_channels,
                  hint=None, freq=None, type_=None, shape=None):
         super().__init__()
 
-        QtUic.loadUi(metro.resource_filename(
-            __name__, 'channels_select.ui'), self)
+        self.setupUi(self)
 
-        channel_names = sorted(metro.queryChannels(hint, freq, type_, shape))
+        excluded_channels = frozenset(excluded_channels or ())
 
-        for channel_name in channel_names:
-            if channel_name in excluded_channels:
-                continue
+        channel_names = [
+            channel_name for channel_name
+            in sorted(metro.queryChannels(hint, freq, type_, shape))
+            if channel_name not in excluded_channels
+        ]
 
-            channel_item = QtWidgets.QListWidgetItem(channel_name,
-                                                     self.listChannels)
-            self.listChannels.addItem(channel_item)
+        self.model = QtCore.QStringListModel(channel_names, self)
+        self.listChannels.setModel(self.model)
 
-            if selected_channel == channel_name:
-                channel_item.setSelected(True)
+        if selected_channel in channel_names:
+            self.listChannels.setCurrentIndex(self.model.index(
+                channel_names.index(selected_channel)))
 
     def getSelectedChannel(self):
         try:
-            return self.listChannels.selectedItems()[0].text()
+            return self.listChannels.selectedIndexes()[0].data()
         except IndexError:
             # In case nothing is selected
             return None
 
     @metro.QSlot()
     def on_buttonBox_accepted(self):
-        if len(self.listChannels.selectedItems()) == 0:
+        if not self.listChannels.selectedIndexes():
             metro.app.showError('An error occured with the entered data:',
                                 'No channel is selected.')
             return
@@ -857,8 +870,11 @@ class SelectChannelDialog(QtWidgets.QDialog):
         self.accept()
 
 
-class DisplayChannelDialog(QtWidgets.QDialog):
+class DisplayChannelDialog(QtWidgets.QDialog,
+                           _loadUiType('channels_display.ui')):
     class NumericChannelDataModel(QtCore.QAbstractTableModel):
+        FETCH_SIZE = 500
+
         def __init__(self, channel):
             super().__init__()
 
@@ -866,26 +882,63 @@ class DisplayChannelDialog(QtWidgets.QDialog):
 
             self.col_count = max(1, channel.shape)
             self.raw_data = None
+
+            # Rows are exposed to the view in batches as it scrolls
+            # towards the end, so only row_count rows out of all
+            # available ones are ever known to it.
+            self.total_count = 0
             self.row_count = 0
 
         def setStep(self, step_idx):
-            self.beginResetModel()
-
             try:
-                self.raw_data = self.channel.getData(step_idx)
+                raw_data = self.channel.getData(step_idx)
             except ValueError as e:
                 metro.app.showError('An error occured when retrieving channel '
                                     'data', str(e), details=e)
-                self.row_count = 0
-                self.endResetModel()
+                raw_data = None
 
             try:
-                self.row_count = len(self.raw_data)
+                total_count = len(raw_data)
             except TypeError:
                 # if None
-                self.row_count = 0
+                total_count = 0
+
+            if total_count >= self.row_count:
+                # All rows known to the view are still present, so only
+                # their values changed, which spares the view from
+                # dropping its caches and scroll position.
+                self.raw_data = raw_data
+                self.total_count = total_count
+
+                if self.row_count > 0:
+                    self.dataChanged.emit(
+                        self.index(0, 0),
+                        self.index(self.row_count - 1, self.col_count - 1),
+                        [QtCore.Qt.DisplayRole]
+                    )
+
+                if self.row_count < self.FETCH_SIZE:
+                    self.fetchMore(QtCore.QModelIndex())
+            else:
+                self.beginResetModel()
+                self.raw_data = raw_data
+                self.total_count = total_count
+                self.row_count = min(total_count, self.FETCH_SIZE)
+                self.endResetModel()
+
+        def canFetchMore(self, parent):
+            return self.row_count < self.total_count
+
+        def fetchMore(self, parent):
+            count = min(self.total_count - self.row_count, self.FETCH_SIZE)
+
+            if count <= 0:
+                return
 
-            self.endResetModel()
+            self.beginInsertRows(QtCore.QModelIndex(), self.row_count,
+                                 self.row_count + count - 1)
+            self.row_count += count
+            self.endInsertRows()
 
         def rowCount(self, parent):
             return self.row_count
@@ -908,8 +961,18 @@ class DisplayChannelDialog(QtWidgets.QDialog):
         self.channel = channel
         self.by_value_idx = None
 
-        QtUic.loadUi(metro.resource_filename(
-            __name__, 'channels_display.ui'), self)
+        # Set while the step index and value widgets are synchronized
+        # to prevent their slots from triggering each other.
+        self._syncing = False
+
+        self.setupUi(self)
+
+        # Scrubbing through the step index only shows the step it comes
+        # to rest on rather than all the ones passed in between.
+        self.step_timer = QtCore.QTimer(self)
+        self.step_timer.setSingleShot(True)
+        self.step_timer.setInterval(100)
+        self.step_timer.timeout.connect(self._onStepTimeout)
 
         self.setWindowTitle('{0} - Metro'.format(channel.name))
 
@@ -921,10 +984,10 @@ class DisplayChannelDialog(QtWidgets.QDialog):
             if channel.step_values:
                 self.editStepIndex.setMaximum(len(channel.step_values)-1)
 
-                idx = 0
-                for v in channel.step_values:
-                    self.selectStepValue.addItem(str(v), idx)
-                    idx += 1
+                # The item index doubles as step index, so no user data
+                # is required and all items can be added in one go.
+                self.selectStepValue.addItems(
+                    [str(v) for v in channel.step_values])
             else:
                 self.checkStepSpecific.setEnabled(False)
                 self.editStepIndex.setEnabled(False)
@@ -948,6 +1011,7 @@ class DisplayChannelDialog(QtWidgets.QDialog):
 
     @QtCore.pyqtSlot()
     def on_buttonBox_accepted(self):
+        self.step_timer.stop()
         self.channel = None
 
         try:
@@ -959,11 +1023,19 @@ class DisplayChannelDialog(QtWidgets.QDialog):
         self.accept()
         self.close()
 
+    def _showStep(self, step_idx):
+        self.step_timer.stop()
+
+        if self.current_step == step_idx:
+            return
+
+        self.current_step = step_idx
+        self.model.setStep(self.current_step)
+
     @QtCore.pyqtSlot(bool)
     def on_checkStepCurrent_toggled(self, flag):
         if flag:
-            self.current_step = metro.NumericChannel.CURRENT_STEP
-            self.model.setStep(self.current_step)
+            self._showStep(metro.NumericChannel.CURRENT_STEP)
 
             self.buttonClear.setEnabled(True)
 
@@ -973,43 +1045,50 @@ class DisplayChannelDialog(QtWidgets.QDialog):
             # This may happen when we set to 'all' for non-continuous
             # channels during creation.
             return
-        pass
 
         if flag:
-            self.current_step = metro.NumericChannel.ALL_STEPS
-            self.model.setStep(self.current_step)
+            self._showStep(metro.NumericChannel.ALL_STEPS)
 
             self.buttonClear.setEnabled(False)
 
     @QtCore.pyqtSlot(bool)
     def on_checkStepSpecific_toggled(self, flag):
         if flag:
-            self.current_step = self.editStepIndex.value()
-            self.model.setStep(self.current_step)
+            self._showStep(self.editStepIndex.value())
 
             self.buttonClear.setEnabled(False)
 
     @QtCore.pyqtSlot(int)
     def on_editStepIndex_valueChanged(self, value):
-        if self.checkStepSpecific.isChecked():
-            if self.current_step == value:
-                return
+        if self._syncing or not self.checkStepSpecific.isChecked():
+            return
 
-            self.current_step = value
-            self.model.setStep(self.current_step)
+        self.step_timer.start()
 
+        self._syncing = True
+
+        try:
             self.selectStepValue.setCurrentIndex(value)
+        finally:
+            self._syncing = False
 
     @QtCore.pyqtSlot(int)
     def on_selectStepValue_currentIndexChanged(self, idx):
-        if self.checkStepSpecific.isChecked():
-            if self.current_step == idx:
-                return
+        if self._syncing or not self.checkStepSpecific.isChecked():
+            return
 
-            self.current_step = idx
-            self.model.setStep(self.current_step)
+        self._showStep(idx)
+
+        self._syncing = True
 
+        try:
             self.editStepIndex.setValue(idx)
+        finally:
+            self._syncing = False
+
+    def _onStepTimeout(self):
+        if self.checkStepSpecific.isChecked():
+            self._showStep(self.editStepIndex.value())
 
     @QtCore.pyqtSlot()
     def on_buttonRefresh_clicked(self):
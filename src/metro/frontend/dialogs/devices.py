@@ -64,25 +64,25 @@ class DeviceArgumentsDialog(QtWidgets.QDialog):
         self.setWindowTitle(f'Arguments of {device._name} - '
                             f'{metro.WINDOW_TITLE}')
 
-        layout = QtWidgets.QGridLayout(self)
+        layout = QtWidgets.QFormLayout(self)
         layout.setHorizontalSpacing(20)
         layout.setVerticalSpacing(8)
 
-        current_row = 0
+        key_font = self.font()
+        key_font.setItalic(True)
 
         for key, value in device._args.items():
-            layout.addWidget(QtWidgets.QLabel('<i>{0}</i>'.format(key)),
-                             current_row, 0)
-            layout.addWidget(QtWidgets.QLabel(str(value)), current_row, 1)
+            label_key = QtWidgets.QLabel(key)
+            label_key.setTextFormat(QtCore.Qt.PlainText)
+            label_key.setFont(key_font)
 
-            current_row += 1
+            layout.addRow(label_key, QtWidgets.QLabel(str(value)))
 
         self.buttonBox = QtWidgets.QDialogButtonBox(self)
         self.buttonBox.addButton(QtWidgets.QDialogButtonBox.Ok)
 
         self.buttonBox.accepted.connect(self.accept)
 
-        layout.addWidget(self.buttonBox, current_row, 0, 1, 2,
-                         QtCore.Qt.AlignRight)
+        layout.addRow(self.buttonBox)
 
         self.setLayout(layout)
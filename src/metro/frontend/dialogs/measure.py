@@ -6,6 +6,7 @@
 
 import math  # noqa
 
+import numpy
 from PyQt5 import QtCore
 from PyQt5 import QtWidgets
 from PyQt5 import uic as QtUic
@@ -23,9 +24,21 @@ class ConfigMeasurementDialog(QtWidgets.QDialog):
             self.op_key = op_key
             self.builtins = builtins
 
+            # Resolve the builtin operator classes and their configuration
+            # dialogs once instead of for every use.
+            self._op_classes = {name: getattr(measure, name, None)
+                                for name in builtins}
+            self._dialog_classes = {
+                name: getattr(ConfigMeasurementDialog, name + 'Dialog', None)
+                for name in builtins
+            }
+
             self.menu = QtWidgets.QMenu()
             self.menu.triggered.connect(self.on_menu_triggered)
 
+            # Operators listed in the menu when it was last built.
+            self._menu_sig = None
+
             self.configure(builtins[0])
 
         def serialize(self):
@@ -36,17 +49,12 @@ class ConfigMeasurementDialog(QtWidgets.QDialog):
                 return metro.app.main_window
 
             if self.op_name in self.builtins:
-                op_class = getattr(measure, self.op_name)
-                op_args = self.op_args.copy()
-
-                internal_keys = []
-
-                for key in self.op_args.keys():
-                    if key.startswith('__') and key.endswith('__'):
-                        internal_keys.append(key)
+                op_class = self._op_classes[self.op_name]
 
-                for key in internal_keys:
-                    del op_args[key]
+                # Skip internal keys like __quick_ctrl__
+                op_args = {key: value for key, value in self.op_args.items()
+                           if not (key.startswith('__') and
+                                   key.endswith('__'))}
 
                 return op_class(**op_args)
             else:
@@ -75,10 +83,9 @@ class ConfigMeasurementDialog(QtWidgets.QDialog):
                 op_name = self.op_name
                 initial_values = self.op_args
 
-            try:
-                dialog_class = getattr(ConfigMeasurementDialog,
-                                       op_name + 'Dialog')
-            except AttributeError:
+            dialog_class = self._dialog_classes.get(op_name)
+
+            if dialog_class is None:
                 self.op_args = initial_values
                 item_str = '{0}: {1}'.format(self.op_key.capitalize(), op_name)
             else:
@@ -102,6 +109,18 @@ class ConfigMeasurementDialog(QtWidgets.QDialog):
             self.setText(0, item_str)
 
         def getMenu(self):
+            ops = metro.getAllOperators(self.op_key)
+            menu_sig = tuple(sorted(ops.keys()))
+
+            if menu_sig == self._menu_sig:
+                # Same operators as last time, only the selection may
+                # have changed.
+                for action in self.menu.actions():
+                    if action.isCheckable():
+                        action.setChecked(action.text() == self.op_name)
+
+                return self.menu
+
             self.menu.clear()
 
             for op_name in self.builtins:
@@ -111,18 +130,18 @@ class ConfigMeasurementDialog(QtWidgets.QDialog):
                 if op_name == self.op_name:
                     new_action.setChecked(True)
 
-            ops = metro.getAllOperators(self.op_key)
-
             if len(self.builtins) > 0 and len(ops) > 0:
                 self.menu.addSeparator()
 
-            for op_name in sorted(ops.keys()):
+            for op_name in menu_sig:
                 new_action = self.menu.addAction(op_name)
                 new_action.setCheckable(True)
 
                 if op_name == self.op_name:
                     new_action.setChecked(True)
 
+            self._menu_sig = menu_sig
+
             return self.menu
 
         # should be QtCore.pyqtSlot(QtWidgets.QAction)
@@ -163,27 +182,27 @@ class ConfigMeasurementDialog(QtWidgets.QDialog):
             self.scan_item.configure(*scan_state, show_dialog=show_dialog)
 
         def operatorText(self, idx):
-            return '{0}/{1}\n{0}/{2}'.format(idx, self.child(0).text(0),
-                                             self.child(1).text(0))
+            return (f'{idx}/{self.point_item.text(0)}\n'
+                    f'{idx}/{self.scan_item.text(0)}')
 
     class FixedPointsDialog(QtWidgets.QDialog):
-        @staticmethod
-        def _idn(x):
-            return x
-
         def __init__(self, initial_values):
             super().__init__()
 
             QtUic.loadUi(metro.resource_filename(
                 __name__, 'measure_fixedpoints.ui'), self)
 
+            # The points are kept in sync with the list widget, so they
+            # need not be parsed back from its items.
             try:
-                self.points = initial_values['points']
+                self.points = list(initial_values['points'])
             except KeyError:
                 self.points = []
             else:
-                for k in initial_values['points']:
-                    self.listPoints.addItem(str(k))
+                self.listPoints.addItems([str(k) for k in self.points])
+
+            # Compiled custom functions by their source text.
+            self._func_cache = {}
 
         def arg_string(self):
             n_points = len(self.points)
@@ -196,21 +215,54 @@ class ConfigMeasurementDialog(QtWidgets.QDialog):
         def getArgs(self):
             return {'points': self.points}
 
+        @staticmethod
+        def _applyFunction(func, values):
+            # Most custom functions are arithmetic expressions, which can
+            # be evaluated for all values at once. Anything else, e.g.
+            # functions of the math module or conditionals, is applied
+            # to each value separately.
+            try:
+                with numpy.errstate(all='raise'):
+                    result = numpy.asarray(func(values), dtype=numpy.float64)
+            except Exception:
+                pass
+            else:
+                if result.shape == values.shape:
+                    return result.tolist()
+
+            return [float(func(v)) for v in values.tolist()]
+
         def _addValues(self, values):
+            values = numpy.atleast_1d(numpy.asarray(values,
+                                                    dtype=numpy.float64))
+
             if self.checkApplyFunction.isChecked():
+                src = self.editFunction.text()
+                func = self._func_cache.get(src)
+
+                if func is None:
+                    try:
+                        func = eval(compile('lambda x: ' + src, '<function>',
+                                            'eval'))
+                    except SyntaxError as e:
+                        metro.app.showException('An error occured when '
+                                                'compiling the custom '
+                                                'function:', e)
+                        return
+
+                    self._func_cache[src] = func
+
                 try:
-                    func = eval('lambda x: ' + self.editFunction.text())
-                except SyntaxError as e:
-                    metro.app.showException('An error occured when compiling '
+                    new_points = self._applyFunction(func, values)
+                except Exception as e:
+                    metro.app.showException('An error occured when applying '
                                             'the custom function:', e)
+                    return
             else:
-                func = self._idn
+                new_points = values.tolist()
 
-            if isinstance(values, float):
-                self.listPoints.addItem(str(func(values)))
-            else:
-                for v in values:
-                    self.listPoints.addItem(str(func(v)))
+            self.points.extend(new_points)
+            self.listPoints.addItems([str(p) for p in new_points])
 
         @QtCore.pyqtSlot()
         def on_buttonSingleValue_clicked(self):
@@ -235,24 +287,25 @@ class ConfigMeasurementDialog(QtWidgets.QDialog):
 
             seq_count = self.editSeqCount.value()
 
-            self._addValues([seq_start + i * seq_step
-                             for i in range(seq_count)])
+            self._addValues(numpy.arange(seq_count, dtype=numpy.float64)
+                            * seq_step + seq_start)
 
         @QtCore.pyqtSlot()
         def on_buttonClear_clicked(self):
-            for item in self.listPoints.selectedItems():
-                self.listPoints.takeItem(self.listPoints.row(item))
+            rows = sorted((self.listPoints.row(item) for item
+                           in self.listPoints.selectedItems()), reverse=True)
+
+            for row in rows:
+                self.listPoints.takeItem(row)
+                del self.points[row]
 
         @QtCore.pyqtSlot()
         def on_buttonBox_accepted(self):
-            if self.listPoints.count() == 0:
+            if not self.points:
                 metro.app.showError('An error occured with the entered data:',
                                     'The list of points is empty')
                 return
 
-            self.points = [float(self.listPoints.item(i).text()) for i
-                           in range(self.listPoints.count())]
-
             self.accept()
 
     class DelayedScanDialog(arguments.ConfigurationDialog):
@@ -312,6 +365,9 @@ class ConfigMeasurementDialog(QtWidgets.QDialog):
         self.menuModifyMacro.addAction(self.actionDeleteMacro)
         self.selected_macro_idx = 0
 
+        # Maps macro names to their items in listMacros.
+        self._macro_index = {}
+
         self.trigger_item = ConfigMeasurementDialog.OperatorItem(
             'trigger', ['ImmediateTrigger', 'DelayedTrigger']
         )
@@ -344,20 +400,17 @@ class ConfigMeasurementDialog(QtWidgets.QDialog):
         return scanset_item
 
     def _removeScanset(self, item_idx):
-        scanset_item = self.treeMeas.topLevelItem(item_idx)
-
-        scanset_item.takeChild(0)
-        scanset_item.takeChild(0)
+        # Taking the item detaches its operator children along with it.
         self.treeMeas.takeTopLevelItem(item_idx)
 
-    def _updateScansetNames(self):
-        scanset_idx = 0
+    def _getScansetItems(self):
+        tree = self.treeMeas
+        return [tree.topLevelItem(item_idx) for item_idx
+                in range(3, tree.topLevelItemCount())]
 
-        for item_idx in range(3, self.treeMeas.topLevelItemCount()):
-            self.treeMeas.topLevelItem(item_idx).setText(
-                0, 'Scan set ' + str(scanset_idx)
-            )
-            scanset_idx += 1
+    def _updateScansetNames(self):
+        for scanset_idx, item in enumerate(self._getScansetItems()):
+            item.setText(0, f'Scan set {scanset_idx}')
 
     def showEvent(self, event):
         metro.app.main_window.prev_unnamed_macro = None
@@ -379,32 +432,54 @@ class ConfigMeasurementDialog(QtWidgets.QDialog):
         return state
 
     def restore(self, state):
-        for name, macro_data in state['macros'].items():
-            new_item = QtWidgets.QListWidgetItem(name)
-            new_item.setData(QtCore.Qt.UserRole, macro_data[0])
-            new_item.setData(QtCore.Qt.ToolTipRole, macro_data[1])
-            self.listMacros.addItem(new_item)
-            metro.app.main_window.selectOperatorMacro.addItem(name)
+        self.listMacros.setUpdatesEnabled(False)
+        self.listMacros.blockSignals(True)
+
+        try:
+            for name, macro_data in state['macros'].items():
+                new_item = QtWidgets.QListWidgetItem(name)
+                new_item.setData(QtCore.Qt.UserRole, macro_data[0])
+                new_item.setData(QtCore.Qt.ToolTipRole, macro_data[1])
+                self.listMacros.addItem(new_item)
+                self._macro_index[name] = new_item
+        finally:
+            self.listMacros.blockSignals(False)
+            self.listMacros.setUpdatesEnabled(True)
+
+        # Insert all names into the main window's combo box at once.
+        macro_box = metro.app.main_window.selectOperatorMacro
+        macro_box.blockSignals(True)
+
+        try:
+            macro_box.addItems(list(state['macros']))
+        finally:
+            macro_box.blockSignals(False)
 
         self.loadMacro(state)
 
     def serializeScansets(self):
-        state = []
+        return [item.serialize() for item in self._getScansetItems()]
 
-        for item_idx in range(3, self.treeMeas.topLevelItemCount()):
-            state.append(self.treeMeas.topLevelItem(item_idx).serialize())
+    def configureScansets(self, state):
+        # Rebuilding the scansets would otherwise repaint the tree for
+        # every single item added or removed.
+        self.treeMeas.setUpdatesEnabled(False)
+        self.treeMeas.blockSignals(True)
 
-        return state
+        try:
+            # Remove from the tail, so no index is shifted or skipped.
+            while self.treeMeas.topLevelItemCount() > 3:
+                self._removeScanset(self.treeMeas.topLevelItemCount() - 1)
 
-    def configureScansets(self, state):
-        for item_idx in range(3, self.treeMeas.topLevelItemCount()):
-            self._removeScanset(item_idx)
+            for scanset_state in state:
+                scanset_item = self._addScanset()
+                scanset_item.configure(*scanset_state)
 
-        for scanset_state in state:
-            scanset_item = self._addScanset()
-            scanset_item.configure(*scanset_state)
+            self._updateScansetNames()
+        finally:
+            self.treeMeas.blockSignals(False)
+            self.treeMeas.setUpdatesEnabled(True)
 
-        self._updateScansetNames()
         self.treeMeas.expandAll()
 
     def saveMacro(self, list_item=None):
@@ -417,20 +492,20 @@ class ConfigMeasurementDialog(QtWidgets.QDialog):
         }
 
         if list_item is not None:
-            list_item.setData(QtCore.Qt.UserRole, self.saveMacro())
-            list_item.setData(QtCore.Qt.ToolTipRole, '\n'.join(
-                [self.treeMeas.topLevelItem(idx).text(0) for idx in range(3)] +
-                [self.treeMeas.topLevelItem(idx).operatorText(idx-3)
-                 for idx in range(3, self.treeMeas.topLevelItemCount())]
-            ))
+            lines = [item.text(0) for item in (self.trigger_item,
+                                               self.limit_item,
+                                               self.status_item)]
+            lines.extend(item.operatorText(scanset_idx) for scanset_idx, item
+                         in enumerate(self._getScansetItems()))
+
+            list_item.setData(QtCore.Qt.UserRole, state)
+            list_item.setData(QtCore.Qt.ToolTipRole, '\n'.join(lines))
 
         return state
 
     def loadMacro(self, state):
         if isinstance(state, str):
-            state = self.listMacros.findItems(
-                state, QtCore.Qt.MatchExactly
-            )[0].data(QtCore.Qt.UserRole)
+            state = self._macro_index[state].data(QtCore.Qt.UserRole)
 
         self.editScanAmount.setValue(state['n_scans'])
 
@@ -448,9 +523,8 @@ class ConfigMeasurementDialog(QtWidgets.QDialog):
         self.quick_ctrl_n_scans = n_scans
         self.editScanAmount.setValue(n_scans)
 
-        if self.treeMeas.topLevelItemCount() > 4:
-            for idx in range(4, self.treeMeas.topLevelItemCount()):
-                self.treeMeas.takeTopLevelItem(idx)
+        while self.treeMeas.topLevelItemCount() > 4:
+            self._removeScanset(self.treeMeas.topLevelItemCount() - 1)
 
         self.treeMeas.topLevelItem(3).configure(
             ('FixedPoints', {'points': points, '__quick_ctrl__': True}),
@@ -458,18 +532,15 @@ class ConfigMeasurementDialog(QtWidgets.QDialog):
         )
 
     def getOperators(self):
-        if self.treeMeas.topLevelItemCount() > 4:
-            operators = []
+        scanset_items = self._getScansetItems()
 
-            for item_idx in range(3, self.treeMeas.topLevelItemCount()):
-                operators.append(
-                    self.treeMeas.topLevelItem(item_idx).getOperators()
-                )
-
-            point_op = measure.ScansetProxy(operators)
+        if len(scanset_items) > 1:
+            point_op = measure.ScansetProxy(
+                [item.getOperators() for item in scanset_items]
+            )
             scan_op = point_op
         else:
-            point_op, scan_op = self.treeMeas.topLevelItem(3).getOperators()
+            point_op, scan_op = scanset_items[0].getOperators()
 
         trigger_op = self.trigger_item.getOperator()
         limit_op = self.limit_item.getOperator()
@@ -549,9 +620,9 @@ class ConfigMeasurementDialog(QtWidgets.QDialog):
         except TypeError:
             pass
 
-        self._addScanset()
+        scanset_item = self._addScanset()
         self._updateScansetNames()
-        self.treeMeas.expandAll()
+        self.treeMeas.expandItem(scanset_item)
 
     @QtCore.pyqtSlot(bool)
     def on_actionUpScanset_triggered(self, checked):
@@ -564,7 +635,7 @@ class ConfigMeasurementDialog(QtWidgets.QDialog):
         self.treeMeas.insertTopLevelItem(item_idx - 1, item)
 
         self._updateScansetNames()
-        self.treeMeas.expandAll()
+        self.treeMeas.expandItem(item)
 
     @QtCore.pyqtSlot(bool)
     def on_actionDownScanset_triggered(self, checked):
@@ -577,7 +648,7 @@ class ConfigMeasurementDialog(QtWidgets.QDialog):
         self.treeMeas.insertTopLevelItem(item_idx + 1, item)
 
         self._updateScansetNames()
-        self.treeMeas.expandAll()
+        self.treeMeas.expandItem(item)
 
     @QtCore.pyqtSlot(bool)
     def on_actionRemoveScanset_triggered(self, checked):
@@ -607,8 +678,7 @@ class ConfigMeasurementDialog(QtWidgets.QDialog):
     def on_actionAddMacro_triggered(self, checked):
         value, success = QtWidgets.QInputDialog.getItem(
             self, 'Add macro - Metro', 'Please enter a name for this macro',
-            [''] + [self.listMacros.item(idx).text()
-                    for idx in range(self.listMacros.count())],
+            [''] + list(self._macro_index.keys()),
             editable=True
         )
 
@@ -616,10 +686,11 @@ class ConfigMeasurementDialog(QtWidgets.QDialog):
             return
 
         try:
-            item = self.listMacros.findItems(value, QtCore.Qt.MatchExactly)[0]
-        except IndexError:
+            item = self._macro_index[value]
+        except KeyError:
             item = QtWidgets.QListWidgetItem(value)
             self.listMacros.addItem(item)
+            self._macro_index[value] = item
             metro.app.main_window.selectOperatorMacro.addItem(value)
         else:
             res = QtWidgets.QMessageBox.warning(
@@ -645,6 +716,7 @@ class ConfigMeasurementDialog(QtWidgets.QDialog):
             return
 
         item = self.listMacros.takeItem(self.selected_macro_idx)
+        del self._macro_index[item.text()]
 
         idx = metro.app.main_window.selectOperatorMacro.findText(
             item.text(), QtCore.Qt.MatchExactly
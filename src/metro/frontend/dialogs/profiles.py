@@ -22,34 +22,26 @@ class SaveProfileDialog(QtWidgets.QDialog):
 
         self.setWindowTitle(f'Save profile - {metro.WINDOW_TITLE}')
 
-        for profile in profiles:
-            self.editName.addItem(os.path.basename(profile)[:-5])
-
+        self.editName.addItems([
+            os.path.splitext(os.path.basename(profile))[0]
+            for profile in profiles
+        ])
         self.editName.lineEdit().setText('')
 
-        device_list = sorted(metro.getAllDevices(),
-                             key=lambda x: x.getDeviceName())
-
-        for device in device_list:
-            device_item = QtWidgets.QListWidgetItem(device.getDeviceName(),
-                                                    self.listDevices)
-            self.listDevices.addItem(device_item)
-
-            device_item.setSelected(True)
-
-        channels_list = sorted(metro.getAllChannels(), key=lambda x: x.name)
-
-        for channel in channels_list:
-            if not (hasattr(channel, '_custom') or
-                    hasattr(channel, '_replayed')):
-                continue
-
-            channel_item = QtWidgets.QListWidgetItem(channel.name,
-                                                     self.listChannels)
-
-            self.listChannels.addItem(channel_item)
-
-            channel_item.setSelected(True)
+        # All devices and channels are selected initially.
+        self.listDevices.addItems(sorted(
+            device.getDeviceName() for device in metro.getAllDevices()
+        ))
+        self.listDevices.selectAll()
+
+        # The markers for custom and replayed channels are always set
+        # as plain instance attributes.
+        self.listChannels.addItems(sorted(
+            channel.name for channel in metro.getAllChannels()
+            if '_custom' in channel.__dict__
+            or '_replayed' in channel.__dict__
+        ))
+        self.listChannels.selectAll()
 
     def getPath(self):
         return '{0}/{1}.json'.format(
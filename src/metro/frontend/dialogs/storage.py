@@ -4,9 +4,14 @@
 # file, You can obtain one at https://mozilla.org/MPL/2.0/.
 
 
+import io
 import os
+import bisect
 import json
+import mmap
 import hashlib
+import functools
+import concurrent.futures
 
 import numpy
 import h5py
@@ -18,84 +23,154 @@ import metro
 
 
 class ReplayStreamChannelDialog(QtWidgets.QDialog):
+    _PROGRESS_LABELS = ('Loading', 'Loading.', 'Loading..', 'Loading...')
+
+    # Header tags and the keys they are stored under.
+    _HEADER_KEYS = {'Name': 'name', 'Shape': 'shape', 'Hint': 'hint',
+                    'Frequency': 'freq'}
+
     class MetroFileLoader(QtCore.QThread):
-        def __init__(self, path, shape, body_offset):
+        def __init__(self, path, shape):
             super().__init__()
 
             self.path = path
             self.shape = shape
-            self.body_offset = body_offset
 
-        def run(self):
-            self.step_values = []
-            self.chunks = []
+        @staticmethod
+        def _scan_markers(mm):
+            # Returns the (start, end) offsets of all marker lines.
+            markers = []
 
-            with open(self.path, 'r') as fp:
-                # Find our first step marker if there is any
-                for line in fp:
-                    if line.startswith('# STEP'):
-                        self.step_values.append(
-                            line.rstrip()[line.find(':')+2:]
-                        )
-                    elif not line.startswith('#'):
-                        break
+            if mm[:1] == b'#':
+                start = 0
+            else:
+                start = mm.find(b'\n#') + 1
 
-                fp.seek(self.body_offset)
+                if not start:
+                    return markers
 
-                step_idx = 0
-                eos = False  # end-of-scan
-                eof = False  # end-of-file
+            while True:
+                end = mm.find(b'\n', start) + 1 or len(mm)
+                markers.append((start, end))
 
-                def read_cells():
-                    nonlocal fp, step_idx, eos, eof
+                start = mm.find(b'\n#', end - 1) + 1
 
-                    for line in fp:
-                        if line.startswith('# SCAN'):
-                            eos = True
-                            break
-                        elif line.startswith('# STEP'):
-                            step_value = line.rstrip()[line.find(':')+2:]
+                if not start:
+                    break
 
-                            try:
-                                self.step_values[step_idx+1] = step_value
-                            except IndexError:
-                                self.step_values.append(step_value)
+            return markers
 
-                            break
-                        elif line.startswith('#'):
-                            # Skip any remaining markers
-                            continue
+        def _parseRegion(self, mm, start, end, out):
+            if self.shape < 2:
+                # Scalar rows contain no delimiter to split on.
+                out[:] = numpy.fromstring(mm[start:end], dtype=numpy.float64,
+                                          sep='\n')
+            else:
+                out[:] = numpy.loadtxt(
+                    io.BytesIO(mm[start:end]), dtype=numpy.float64,
+                    comments=None, delimiter='\t', ndmin=2
+                )
 
-                        cols = line.rstrip().split('\t')
+        def run(self):
+            self.step_values = []
 
-                        for item in cols:
-                            yield float(item)
+            # Data regions between markers as (start, end, step_idx)
+            regions = []
+
+            with open(self.path, 'rb') as fp, \
+                    mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                # Let the kernel read the whole file ahead asynchronously
+                # while the markers are scanned, where supported.
+                if hasattr(mmap, 'MADV_WILLNEED'):
+                    mm.madvise(mmap.MADV_WILLNEED)
+
+                # Only the marker lines are visited in Python, while
+                # the data regions in between are left to numpy.
+                step_idx = None
+                data_start = 0
+
+                for start, end in self._scan_markers(mm):
+                    if start > data_start:
+                        regions.append((data_start, start, step_idx or 0))
+
+                    data_start = end
+                    line = mm[start:end]
+
+                    if line.startswith(b'# SCAN'):
+                        step_idx = None
+                    elif line.startswith(b'# STEP'):
+                        step_idx = 0 if step_idx is None else step_idx + 1
+                        step_value = line[line.find(b':')+2:].decode().rstrip()
+
+                        try:
+                            self.step_values[step_idx] = step_value
+                        except IndexError:
+                            self.step_values.append(step_value)
+                    elif b'ABORTED' in line:
+                        break
+                else:
+                    if len(mm) > data_start:
+                        regions.append((data_start, len(mm), step_idx or 0))
 
-                    if not line.startswith('#') or 'ABORTED' in line:
-                        eof = True
+                # Count the rows of each step first, so its final array
+                # can be allocated once and filled region by region.
+                step_rows = []
+                region_rows = []
 
-                while not eof:
-                    chunk = numpy.fromiter(read_cells(), dtype=float)
+                for start, end, step_idx in regions:
+                    rows = mm[start:end].count(b'\n')
 
-                    if step_idx == len(self.chunks):
-                        self.chunks.append([])
+                    if mm[end-1:end] != b'\n':
+                        rows += 1
 
-                    self.chunks[step_idx].append(chunk)
+                    while step_idx >= len(step_rows):
+                        step_rows.append(0)
 
-                    if eos:
-                        step_idx = 0
-                        eos = False
-                    else:
-                        step_idx += 1
+                    step_rows[step_idx] += rows
+                    region_rows.append(rows)
 
-            self.data = []
+                # Steps at the end without any data remain empty.
+                while len(step_rows) < len(self.step_values):
+                    step_rows.append(0)
 
-            for i in range(len(self.chunks)):
-                self.data.append(numpy.concatenate(self.chunks[i]))
+                row_shape = (self.shape,) if self.shape > 1 else ()
 
+                if len(set(step_rows)) == 1:
+                    # All steps are of equal length, so they can share a
+                    # single contiguous block.
+                    self.data = list(numpy.empty(
+                        (len(step_rows), step_rows[0]) + row_shape,
+                        dtype=numpy.float64
+                    ))
+                else:
+                    self.data = [numpy.empty((rows,) + row_shape,
+                                             dtype=numpy.float64)
+                                 for rows in step_rows]
+
+                # Each region is written to its own slice of the step
+                # arrays, so the regions may be parsed concurrently.
+                step_cursors = [0] * len(step_rows)
+                futures = []
+
+                with concurrent.futures.ThreadPoolExecutor() as executor:
+                    for (start, end, step_idx), rows in zip(regions,
+                                                            region_rows):
+                        cursor = step_cursors[step_idx]
+                        step_cursors[step_idx] = cursor + rows
+
+                        futures.append(executor.submit(
+                            self._parseRegion, mm, start, end,
+                            self.data[step_idx][cursor:cursor+rows]
+                        ))
+
+                # Raise any error that occured while parsing.
+                for future in futures:
+                    future.result()
+
+            # The step arrays are allocated in their final shape, but
+            # NumericChannel expects vector steps as a list of chunks.
             if self.shape > 1:
-                for i in range(len(self.data)):
-                    self.data[i] = [self.data[i].reshape((-1, self.shape))]
+                self.data = [[step_data] for step_data in self.data]
 
     def __init__(self, path):
         super().__init__()
@@ -113,23 +188,18 @@ class ReplayStreamChannelDialog(QtWidgets.QDialog):
 
         # First we read in the header
         for line in fp:
-            if line.startswith('# Name'):
-                headers['name'] = line[8:].strip()
-                deprecated = False
-            elif line.startswith('# Shape'):
-                headers['shape'] = line[9:].strip()
-                deprecated = False
-            elif line.startswith('# Hint'):
-                headers['hint'] = line[8:].strip()
-                deprecated = False
-            elif line.startswith('# Frequency'):
-                headers['freq'] = line[13:].strip()
+            sep_idx = line.find(':')
+            tag = line[2:sep_idx]
+
+            header_key = self._HEADER_KEYS.get(tag)
+
+            if header_key is not None:
+                headers[header_key] = line[sep_idx+1:].strip()
                 deprecated = False
-            elif line.startswith('# X-Proj'):
-                headers['proj'].append(json.loads(line[(line.find(':')+1):]))
-            elif line.startswith('# DISPLAY'):
-                key = line[10:line.find(':')]
-                value = line[line.find(':')+2:-1]
+            elif tag.startswith('X-Proj'):
+                headers['proj'].append(json.loads(line[sep_idx+1:]))
+            elif tag.startswith('DISPLAY '):
+                value = line[sep_idx+2:-1]
 
                 try:
                     value = int(value)
@@ -139,7 +209,7 @@ class ReplayStreamChannelDialog(QtWidgets.QDialog):
                     except ValueError:
                         pass
 
-                headers['display'][key] = value
+                headers['display'][tag[8:]] = value
 
             if not line.startswith('#'):
                 self.body_offset = cur_offset
@@ -226,7 +296,7 @@ class ReplayStreamChannelDialog(QtWidgets.QDialog):
             return
 
         self.loader = ReplayStreamChannelDialog.MetroFileLoader(
-            self.path, int(self.headers['shape']), self.body_offset
+            self.path, int(self.headers['shape'])
         )
 
         # TODO: Disable this button when loading starts
@@ -285,13 +355,15 @@ class ReplayStreamChannelDialog(QtWidgets.QDialog):
     @QtCore.pyqtSlot()
     def on_progress_tick(self):
         self.labelProgress.setText(
-            'Loading' + self.progress_iterator % 4 * '.'
+            self._PROGRESS_LABELS[self.progress_iterator & 3]
         )
 
         self.progress_iterator += 1
 
 
 class ReplayDatagramChannelDialog(QtWidgets.QDialog):
+    _PROGRESS_LABELS = ('Loading', 'Loading.', 'Loading..', 'Loading...')
+
     class MetroFileLoader(QtCore.QThread):
         def __init__(self, path):
             super().__init__()
@@ -301,25 +373,44 @@ class ReplayDatagramChannelDialog(QtWidgets.QDialog):
         def run(self):
             self.step_values = []
             self.chunks = []
-            self.display_arguments = {}
 
             with h5py.File(self.path, 'r') as h5f:
                 self.freq = h5f.attrs['freq']
                 self.hint = h5f.attrs['hint']
 
-                for key, value in h5f.attrs.items():
-                    if key.startswith('DISPLAY'):
-                        if isinstance(value, numpy.bool_):
-                            value = bool(value)
-                        elif isinstance(value, numpy.int64):
-                            value = int(value)
-
-                        self.display_arguments[key[8:]] = value
+                # Any numpy scalar is converted to its python equivalent.
+                self.display_arguments = {
+                    key[8:]: (value.item() if isinstance(value, numpy.generic)
+                              else value)
+                    for key, value in h5f.attrs.items()
+                    if key.startswith('DISPLAY')
+                }
 
                 if self.freq == 'step':
-                    self.step_values = [float(v) for v in h5f['0']]
-                    self.data = [numpy.array(h5f['0'][val])
-                                 for val in h5f['0']]
+                    group = h5f['0']
+                    keys = list(group)
+                    datasets = [group[key] for key in keys]
+
+                    self.step_values = [float(key) for key in keys]
+
+                    if datasets and all(
+                        dset.shape == datasets[0].shape and
+                        dset.dtype == datasets[0].dtype
+                        for dset in datasets
+                    ):
+                        # Read all steps into a single block and keep
+                        # views on it.
+                        buf = numpy.empty(
+                            (len(datasets),) + datasets[0].shape,
+                            dtype=datasets[0].dtype
+                        )
+
+                        for i, dset in enumerate(datasets):
+                            dset.read_direct(buf, dest_sel=numpy.s_[i])
+
+                        self.data = list(buf)
+                    else:
+                        self.data = [dset[()] for dset in datasets]
                 else:
                     raise NotImplementedError('Continuous DatagramChannels '
                                               'unsupported')
@@ -393,7 +484,7 @@ class ReplayDatagramChannelDialog(QtWidgets.QDialog):
     @QtCore.pyqtSlot()
     def on_progress_tick(self):
         self.labelProgress.setText(
-            'Loading' + self.progress_iterator % 4 * '.'
+            self._PROGRESS_LABELS[self.progress_iterator & 3]
         )
 
         self.progress_iterator += 1
@@ -408,14 +499,22 @@ class BrowseStorageDialog(QtWidgets.QDialog):
 
             self.files = []
 
-        def setLocation(self, root):
-            self.root = root
+            # Keeps the model in sync with changes to the directory.
+            self.watcher = QtCore.QFileSystemWatcher(self)
+            self.watcher.directoryChanged.connect(
+                self.on_watcher_directoryChanged)
 
+        def _readLocation(self, root):
             new_files = []
+            other_entries = []
+
+            with os.scandir(root) as it:
+                entries = [entry.name for entry in it]
 
             # First we sort out the screenshot as markers
-            for entry in os.listdir(root):
+            for entry in entries:
                 if entry[-4:] != '.jpg':
+                    other_entries.append(entry)
                     continue
 
                 filename = entry[:-4]
@@ -445,21 +544,82 @@ class BrowseStorageDialog(QtWidgets.QDialog):
                     0, filename]
                 )
 
-            for entry in os.listdir(root):
-                if entry[-4:] == '.jpg':
-                    continue
+            files_by_prefix = {details[5]: details for details in new_files}
+
+            # Channel files are named <prefix>_<channel>.<ext>, so only
+            # the prefixes ending at an underscore need to be looked up.
+            for entry in other_entries:
+                pos = entry.find('_')
+
+                while pos != -1:
+                    details = files_by_prefix.get(entry[:pos])
 
-                for details in new_files:
-                    if entry.startswith(details[5]):
+                    if details is not None:
                         details.append(entry)
                         details[4] += 1
 
+                    pos = entry.find('_', pos + 1)
+
+            return new_files
+
+        def setLocation(self, root):
+            self.root = root
+
+            watched_paths = self.watcher.directories()
+
+            if watched_paths:
+                self.watcher.removePaths(watched_paths)
+
+            if os.path.isdir(root):
+                self.watcher.addPath(root)
+
+            new_files = self._readLocation(root)
+
             self.beginResetModel()
 
             self.files = sorted(new_files, key=lambda x: x[0])
 
             self.endResetModel()
 
+        @QtCore.pyqtSlot(str)
+        def on_watcher_directoryChanged(self, path):
+            try:
+                new_files = self._readLocation(self.root)
+            except OSError:
+                # The directory itself is gone.
+                new_files = []
+
+            new_files_by_prefix = {details[5]: details
+                                   for details in new_files}
+            parent = QtCore.QModelIndex()
+
+            # Only the rows that actually changed are updated instead of
+            # resetting the whole model.
+            for row in range(len(self.files) - 1, -1, -1):
+                if self.files[row][5] not in new_files_by_prefix:
+                    self.beginRemoveRows(parent, row, row)
+                    del self.files[row]
+                    self.endRemoveRows()
+
+            for row, details in enumerate(self.files):
+                new_details = new_files_by_prefix.pop(details[5])
+
+                if sorted(details[6:]) != sorted(new_details[6:]):
+                    details[4:] = new_details[4:]
+                    self.dataChanged.emit(self.index(row, 0),
+                                          self.index(row, 4))
+
+            numbers = [details[0] for details in self.files]
+
+            for details in sorted(new_files_by_prefix.values(),
+                                  key=lambda x: x[0]):
+                row = bisect.bisect_right(numbers, details[0])
+
+                self.beginInsertRows(parent, row, row)
+                self.files.insert(row, details)
+                numbers.insert(row, details[0])
+                self.endInsertRows()
+
         def deleteFiles(self, rows):
             parent = QtCore.QModelIndex()
 
@@ -540,15 +700,30 @@ class BrowseStorageDialog(QtWidgets.QDialog):
 
             old_root_len = len(details[5])
 
-            os.rename('{0}/{1}.jpg'.format(self.root, details[5]),
-                      '{0}/{1}.jpg'.format(self.root, new_root))
+            # Where supported, the storage directory is only resolved
+            # once for all files to rename.
+            if os.rename in os.supports_dir_fd:
+                dir_fd = os.open(self.root, os.O_RDONLY | os.O_DIRECTORY)
+                rename = functools.partial(os.rename, src_dir_fd=dir_fd,
+                                           dst_dir_fd=dir_fd)
+            else:
+                dir_fd = None
+
+                def rename(src, dst):
+                    os.rename('{0}/{1}'.format(self.root, src),
+                              '{0}/{1}'.format(self.root, dst))
 
-            for i in range(6, len(details)):
-                new_path = new_root + details[i][old_root_len:]
+            try:
+                rename(details[5] + '.jpg', new_root + '.jpg')
+
+                for i in range(6, len(details)):
+                    new_path = new_root + details[i][old_root_len:]
 
-                os.rename(self.root + '/' + details[i],
-                          self.root + '/' + new_path)
-                details[i] = new_path
+                    rename(details[i], new_path)
+                    details[i] = new_path
+            finally:
+                if dir_fd is not None:
+                    os.close(dir_fd)
 
             details[5] = new_root
 
@@ -603,12 +778,20 @@ class BrowseStorageDialog(QtWidgets.QDialog):
 
         self.menuReplay.popup(e.globalPos())
 
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def _hashFilePrefix(file_prefix):
+        # All channels of a measurement share the same file prefix, so
+        # its hash is only computed once.
+        return hashlib.md5(file_prefix.encode('ascii')).hexdigest()[:6]
+
     @staticmethod
     def _createUniqueChannelName(path, meas_name, channel_name):
-        file_prefix = path[:-(5+len(channel_name))]
-        hash_fragment = hashlib.md5(file_prefix.encode('ascii')).hexdigest()
+        hash_fragment = BrowseStorageDialog._hashFilePrefix(
+            path[:-(5+len(channel_name))]
+        )
 
-        return '{0}-{1}-{2}'.format(hash_fragment[:6], meas_name, channel_name)
+        return '{0}-{1}-{2}'.format(hash_fragment, meas_name, channel_name)
 
     @QtCore.pyqtSlot(int)
     def on_dialogReplay_finished(self, code):
@@ -0,0 +1,62 @@
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+from PyQt5 import QtGui
+
+import metro
+
+
+def setUpModule():
+    global app, widgets
+
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    app = QtGui.QGuiApplication.instance() or QtGui.QGuiApplication([])
+
+    local_path = tempfile.mkdtemp()
+
+    with mock.patch.object(sys, 'argv', ['metro']):
+        args, _ = metro.parse_args('metro')
+
+    metro.init(args, 'Metro', local_path=local_path,
+               profile_path=os.path.join(local_path, 'profiles'))
+
+    from metro.frontend import widgets
+
+
+class TestPythonHighlighter(unittest.TestCase):
+    def highlight(self, text):
+        document = QtGui.QTextDocument()
+        self.highlighter = widgets.PythonHighlighter(document)
+        document.setPlainText(text)
+        self.highlighter.rehighlight()
+
+        return {(r.start, r.length): r.format
+                for r in document.firstBlock().layout().formats()}
+
+    def test_non_bmp_offsets(self):
+        # The emoji takes two UTF-16 code units in Qt.
+        styles = widgets.PythonHighlighter.styles
+        formats = self.highlight('x = \'\U0001F600\'; def foo')
+
+        self.assertEqual(formats[(4, 4)], styles['string'])
+        self.assertEqual(formats[(10, 3)], styles['keyword'])
+        self.assertEqual(formats[(14, 3)], styles['defclass'])
+
+    def test_multiline_string(self):
+        styles = widgets.PythonHighlighter.styles
+        formats = self.highlight('\U0001F600 = \'\'\'abc')
+
+        self.assertEqual(formats[(5, 6)], styles['string2'])
+
+
+if __name__ == '__main__':
+    unittest.main()
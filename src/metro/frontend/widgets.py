@@ -4,7 +4,9 @@
 # file, You can obtain one at https://mozilla.org/MPL/2.0/.
 
 
-from collections import OrderedDict
+import re
+import collections
+import contextlib
 
 from PyQt5 import QtCore
 from PyQt5 import QtGui
@@ -13,62 +15,106 @@ from PyQt5 import QtWidgets
 import metro
 
 
+# Per-link state of a LinksLabel, the channel fields are only used by
+# ChannelLinksLabel.
+class _Entry:
+    __slots__ = ('html', 'label', 'name', 'entry_point', 'args')
+
+    def __init__(self, label):
+        self.html = ''
+        self.label = label
+        self.name = None
+        self.entry_point = None
+        self.args = None
+
+
 class LinksLabel(QtWidgets.QLabel):
     contextRequested = QtCore.pyqtSignal(str, QtCore.QPoint)
 
+    # Style of links with the default formatting
+    _DEFAULT_CSS = ('color: #0057AE; font-weight: normal; '
+                    'font-style: normal; text-decoration: underline')
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
         self.setWordWrap(True)
         self.setContextMenuPolicy(QtCore.Qt.NoContextMenu)
 
-        self.links = OrderedDict()
-        self.labels = {}
+        self.entries = {}
         self.active_link = None
 
+        # The rich text is only set if it actually changed and not at
+        # all during a batch, since Qt has to parse it each time.
+        # Batches may be nested, only the outermost one updates.
+        self._text = ''
+        self._in_batch = 0
+
         self.linkHovered.connect(self.on_linkHovered)
 
     def _update(self):
-        self.setText(', '.join(self.links.values()))
+        if self._in_batch:
+            return
+
+        text = ', '.join(entry.html for entry in self.entries.values())
+
+        if text != self._text:
+            self._text = text
+            self.setText(text)
+
+    def beginBatch(self):
+        self._in_batch += 1
+
+    def endBatch(self):
+        self._in_batch -= 1
+        self._update()
+
+    @contextlib.contextmanager
+    def batched(self):
+        self.beginBatch()
+
+        try:
+            yield self
+        finally:
+            self.endBatch()
 
     def __len__(self):
-        return len(self.labels)
+        return len(self.entries)
 
     def setLink(self, link, label):
-        self.labels[link] = label
+        try:
+            self.entries[link].label = label
+        except KeyError:
+            self.entries[link] = _Entry(label)
+
         self.formatLink(link)
 
     def getLabel(self, link):
-        return self.labels[link]
+        return self.entries[link].label
 
     def formatLink(self, link, color='#0057AE',
                    bold=False, italic=False, underlined=True):
 
-        css = ("color: {0}; "
-               "font-weight: {1}; "
-               "font-style: {2}; "
-               "text-decoration: {3}").format(
-            color,
-            'bold' if bold else 'normal',
-            'italic' if italic else 'normal',
-            'underline' if underlined else 'none'
-        )
+        if color == '#0057AE' and not bold and not italic and underlined:
+            css = self._DEFAULT_CSS
+        else:
+            css = (f'color: {color}; '
+                   f'font-weight: {"bold" if bold else "normal"}; '
+                   f'font-style: {"italic" if italic else "normal"}; '
+                   f'text-decoration: {"underline" if underlined else "none"}')
 
-        html = '<a href="{0}" style="{1}">{2}</a>'.format(link, css,
-                                                          self.labels[link])
+        entry = self.entries[link]
+        entry.html = f'<a href="{link}" style="{css}">{entry.label}</a>'
 
-        self.links[link] = html
         self._update()
 
     def removeLink(self, link):
-        del self.links[link]
-        del self.labels[link]
+        del self.entries[link]
 
         self._update()
 
     def clearLinks(self):
-        self.links.clear()
-        self.labels.clear()
+        self.entries.clear()
 
         self._update()
 
@@ -85,7 +131,11 @@ class ChannelLinksLabel(LinksLabel):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
-        self.channels = {}
+        # Created on first use unless set via setContextMenu
+        self.menuContext = None
+
+        # Labels by channel name to remove all links of a channel
+        self._labels_by_name = collections.defaultdict(set)
 
         self.linkActivated.connect(self.on_linkActivated)
         self.contextRequested.connect(self.on_contextRequested)
@@ -93,6 +143,10 @@ class ChannelLinksLabel(LinksLabel):
     def setContextMenu(self, menu):
         self.menuContext = menu
 
+    def clearLinks(self):
+        self._labels_by_name.clear()
+        super().clearLinks()
+
     def addChannel(self, channel, label=None, entry_point=None, args={},
                    **kwargs):
         if label is None:
@@ -103,65 +157,92 @@ class ChannelLinksLabel(LinksLabel):
         if len(kwargs) > 0:
             self.formatLink(label, **kwargs)
 
-        self.channels[label] = (channel.name, entry_point, args)
+        entry = self.entries[label]
+
+        if entry.name is not None:
+            self._labels_by_name[entry.name].discard(label)
+
+        entry.name = channel.name
+        entry.entry_point = entry_point
+        entry.args = args
+
+        self._labels_by_name[channel.name].add(label)
+
+    # Takes an iterable of (channel, kwargs) tuples with kwargs as
+    # passed to addChannel, but only updates the text once.
+    def addChannels(self, items):
+        with self.batched():
+            for channel, kwargs in items:
+                self.addChannel(channel, **kwargs)
 
     def removeChannel(self, label):
         if isinstance(label, metro.AbstractChannel):
-            labels = []
+            labels = self._labels_by_name.pop(label.name, ())
 
-            channel = label
-            for key, value in self.channels.items():
-                if value[0] == channel.name:
-                    labels.append(key)
-
-            for label in labels:
-                self.removeChannel(label)
+            with self.batched():
+                for label in labels:
+                    self.removeLink(label)
 
         else:
+            channel_name = self.entries[label].name
             self.removeLink(label)
-            del self.channels[label]
+
+            labels = self._labels_by_name[channel_name]
+            labels.discard(label)
+
+            if not labels:
+                del self._labels_by_name[channel_name]
 
     @metro.QSlot(str)
     def on_linkActivated(self, link):
         try:
-            entry = self.channels[link]
+            entry = self.entries[link]
         except KeyError as e:
             metro.app.showError(
                 'An error occured on creating a display device:',
                 'No channel known with label {0}'.format(link), e
             )
         else:
-            metro.app.createDisplayDevice(metro.getChannel(entry[0]),
-                                          entry_point=entry[1],
-                                          args=entry[2])
+            metro.app.createDisplayDevice(metro.getChannel(entry.name),
+                                          entry_point=entry.entry_point,
+                                          args=entry.args)
 
     @metro.QSlot(str, QtCore.QPoint)
     def on_contextRequested(self, link, menu_pos):
-        try:
-            self.menuContext
-        except AttributeError:
+        if self.menuContext is None:
             self.menuContext = ChannelLinkMenu()
 
         try:
-            entry = self.channels[link]
+            entry = self.entries[link]
         except KeyError as e:
             metro.app.showError(
                 'An error occured on creating a channel context menu:',
                 'No channel known with label {0}'.format(link), e
             )
         else:
-            self.menuContext.buildForChannel(*entry)
+            self.menuContext.buildForChannel(entry.name, entry.entry_point,
+                                             entry.args)
             self.menuContext.popup(menu_pos)
 
 
 class LabelableMenu(QtWidgets.QMenu):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self._title_label = None
+
+    def clear(self):
+        # The title label is destroyed along with its action
+        self._title_label = None
+        super().clear()
+
     def setTitle(self, text):
         super().setTitle(text)
 
-        if len(self.actions()) == 0:
-            # We have to recreate this every time since on clear() it
-            # will get destroyed apparently
-            self.addLabel(text)
+        if self._title_label is not None:
+            self._title_label.setText(text)
+        elif len(self.actions()) == 0:
+            self._title_label = self.addLabel(text)
 
     def addLabel(self, text):
         label = QtWidgets.QLabel(text, self)
@@ -172,16 +253,37 @@ class LabelableMenu(QtWidgets.QMenu):
 
         self.addAction(action)
 
+        return label
+
 
 class ChannelLinkMenu(LabelableMenu):
     # Has to be initialized externally, usually by the main controller
     menuDisplayBy = None
 
+    # Methods handling special actions, any other action displays the
+    # channel with its data as entry point.
+    _HANDLERS = {
+        '__raw__': '_displayRawChannel',
+        '__edit__': '_editChannel',
+        '__close__': '_closeChannel',
+        '__duplicate__': '_duplicateChannel',
+        '__clear__': '_clearChannel',
+        '__reset__': '_resetChannel',
+    }
+
     def __init__(self, title=None, parent=None):
         super().__init__(title, parent)
 
         self.menuDisplayBy = QtWidgets.QMenu(self)
 
+        # Channel the menu was last built for and its properties.
+        self._channel = None
+        self._menu_sig = None
+
+        # Shared "Display by" submenu and its action once attached
+        self._display_by_menu = None
+        self._display_by_action = None
+
         self.triggered.connect(self.on_triggered)
 
     def buildForChannel(self, channel, entry_point=None, args={}):
@@ -189,9 +291,22 @@ class ChannelLinkMenu(LabelableMenu):
             # Compatibility with old API
             channel = metro.getChannel(channel)
 
+        self._channel = channel
         self.entry_point = entry_point
         self.args = args
 
+        # The actions only depend on these properties, so the menu is
+        # reused as long as none of them changed.
+        menu_sig = (channel.name, type(channel), hasattr(channel, '_custom'),
+                    hasattr(channel, '_replayed'),
+                    getattr(channel, 'locked', None),
+                    ChannelLinkMenu.menuDisplayBy)
+
+        if menu_sig == self._menu_sig:
+            return
+
+        self._menu_sig = menu_sig
+
         self.clear()
         self.setTitle(channel.name)
 
@@ -199,13 +314,17 @@ class ChannelLinkMenu(LabelableMenu):
 
         self.addAction('Display...').setData('__default__')
 
-        try:
-            self.addMenu(ChannelLinkMenu.menuDisplayBy).setText(
-                'Display by...'
-            )
-        except AttributeError:
-            # Apparently the menu was never initialized
-            pass
+        display_by = ChannelLinkMenu.menuDisplayBy
+
+        # The menu is None if it was never initialized. Otherwise only
+        # its action is added again, its text is only set once.
+        if display_by is not None:
+            if self._display_by_menu is not display_by:
+                self._display_by_menu = display_by
+                self._display_by_action = display_by.menuAction()
+                self._display_by_action.setText('Display by...')
+
+            self.addAction(self._display_by_action)
 
         if isinstance(channel, metro.StreamChannel):
             self.addAction('Display raw...').setData('__raw__')
@@ -235,69 +354,75 @@ class ChannelLinkMenu(LabelableMenu):
         ).setData('__clear__')
         self.addAction('Reset').setData('__reset__')
 
-    # see note in controller regarding decorator on such slots
-    def on_triggered(self, action):
-        channel = metro.getChannel(self.title())
-        name = action.data()
+    def _displayChannel(self, channel, name):
+        if name == '__default__':
+            name = self.entry_point
 
-        if name is None:
-            # Happens on the "header" label
-            return
+        metro.app.createDisplayDevice(channel, name, show_dialog=True,
+                                      args=self.args)
 
-        elif name == '__raw__':
-            metro.app.displayRawChannel(channel)
+    def _displayRawChannel(self, channel, name):
+        metro.app.displayRawChannel(channel)
 
-        elif name == '__edit__':
-            metro.app.editCustomChannel(channel)
+    def _editChannel(self, channel, name):
+        metro.app.editCustomChannel(channel)
 
-        elif name == '__close__':
-            channel.close()
+    def _closeChannel(self, channel, name):
+        channel.close()
 
-        elif name == '__duplicate__':
-            value, success = metro.QtWidgets.QInputDialog.getText(
-                None, f'Duplicate channel - {metro.WINDOW_TITLE}',
-                'Please enter the a name for the duplicated channel:'
-            )
+    def _duplicateChannel(self, channel, name):
+        value, success = metro.QtWidgets.QInputDialog.getText(
+            None, f'Duplicate channel - {metro.WINDOW_TITLE}',
+            'Please enter the a name for the duplicated channel:'
+        )
 
-            if not success:
-                return
-
-            try:
-                new_chan = metro.NumericChannel(
-                    '@'+value, hint=channel.hint, freq=channel.freq,
-                    shape=channel.shape, static=True
-                )
-            except ValueError as e:
-                metro.app.showError('An error occured on creating the '
-                                    'channel.', str(e), details=e)
-                return
-
-            new_chan.copyDataFrom(channel)
-
-        elif name == '__clear__':
-            channel.clearData()
-
-        elif name == '__reset__':
-            res = QtWidgets.QMessageBox.warning(
-                self, f'Reset channel - {metro.WINDOW_TITLE}',
-                'Are you sure to reset this channel?\nThis operation puts the '
-                'channel in the same state as immediately after creation. '
-                'Performing this action during a measurement can lead to '
-                'undefined behaviour.\n\nIf you were looking to just empty '
-                'the current channel buffers, please use "Clear current step" '
-                'instead.',
-                QtWidgets.QMessageBox.Yes | QtWidgets.QMessageBox.No
+        if not success:
+            return
+
+        try:
+            new_chan = metro.NumericChannel(
+                '@'+value, hint=channel.hint, freq=channel.freq,
+                shape=channel.shape, static=True
             )
+        except ValueError as e:
+            metro.app.showError('An error occured on creating the channel.',
+                                str(e), details=e)
+            return
 
-            if res == QtWidgets.QMessageBox.Yes:
-                channel.reset()
+        new_chan.copyDataFrom(channel)
+
+    def _clearChannel(self, channel, name):
+        channel.clearData()
+
+    def _resetChannel(self, channel, name):
+        res = QtWidgets.QMessageBox.warning(
+            self, f'Reset channel - {metro.WINDOW_TITLE}',
+            'Are you sure to reset this channel?\nThis operation puts the '
+            'channel in the same state as immediately after creation. '
+            'Performing this action during a measurement can lead to '
+            'undefined behaviour.\n\nIf you were looking to just empty '
+            'the current channel buffers, please use "Clear current step" '
+            'instead.',
+            QtWidgets.QMessageBox.Yes | QtWidgets.QMessageBox.No
+        )
 
-        else:
-            if name == '__default__':
-                name = self.entry_point
+        if res == QtWidgets.QMessageBox.Yes:
+            channel.reset()
 
-            metro.app.createDisplayDevice(channel, name, show_dialog=True,
-                                          args=self.args)
+    # see note in controller regarding decorator on such slots
+    def on_triggered(self, action):
+        name = action.data()
+
+        if name is None:
+            # Happens on the "header" label
+            return
+
+        handler = getattr(self, self._HANDLERS.get(name, '_displayChannel'))
+        handler(self._channel, name)
+
+
+# Colors by name for PythonHighlighter, so each is only resolved once
+_COLOR_CACHE = {}
 
 
 class PythonHighlighter(QtGui.QSyntaxHighlighter):
@@ -312,8 +437,10 @@ class PythonHighlighter(QtGui.QSyntaxHighlighter):
         """
         Return a QTextCharFormat with the given attributes.
         """
-        color = QtGui.QColor()
-        color.setNamedColor(color_str)
+        try:
+            color = _COLOR_CACHE[color_str]
+        except KeyError:
+            color = _COLOR_CACHE[color_str] = QtGui.QColor(color_str)
 
         text_format = QtGui.QTextCharFormat()
         text_format.setForeground(color)
@@ -360,69 +487,105 @@ class PythonHighlighter(QtGui.QSyntaxHighlighter):
         '\{', '\}', '\(', '\)', '\[', '\]',
     ]
 
-    def __init__(self, document):
-        super().__init__(document)
+    # Shared by all instances, built on first use
+    _compiled_rules = None
 
-        # Multi-line strings (expression, flag, style)
-        # FIXME: The triple-quotes in these two lines will mess up
-        # the syntax highlighting from this point onward
-        self.tri_single = (QtCore.QRegExp("'''"), 1, self.styles['string2'])
-        self.tri_double = (QtCore.QRegExp('"""'), 2, self.styles['string2'])
+    @classmethod
+    def _compileRules(cls):
+        if cls._compiled_rules is not None:
+            return cls._compiled_rules
 
         rules = []
 
-        # Keyword, operator, and brace rules
-        rules += [(r'\b%s\b' % w, 0, self.styles['keyword'])
-                  for w in self.keywords]
-        rules += [(r'%s' % o, 0, self.styles['operator'])
-                  for o in self.operators]
-        rules += [(r'%s' % b, 0, self.styles['brace'])
-                  for b in self.braces]
+        # Keyword, operator, and brace rules, each combined into a
+        # single alternation as they share their format.
+        rules += [
+            (r'\b(?:%s)\b' % '|'.join(cls.keywords), 0,
+             cls.styles['keyword']),
+            ('|'.join(cls.operators), 0, cls.styles['operator']),
+            ('|'.join(cls.braces), 0, cls.styles['brace']),
+        ]
 
         # All other rules
         rules += [
             # 'self'
-            (r'\bself\b', 0, self.styles['self']),
+            (r'\bself\b', 0, cls.styles['self']),
 
             # Double-quoted string, possibly containing escape
             # sequences
-            (r'"[^"\\]*(\\.[^"\\]*)*"', 0, self.styles['string']),
+            (r'"[^"\\]*(\\.[^"\\]*)*"', 0, cls.styles['string']),
             # Single-quoted string, possibly containing escape
             # sequences
-            (r"'[^'\\]*(\\.[^'\\]*)*'", 0, self.styles['string']),
+            (r"'[^'\\]*(\\.[^'\\]*)*'", 0, cls.styles['string']),
 
             # 'def' followed by an identifier
-            (r'\bdef\b\s*(\w+)', 1, self.styles['defclass']),
+            (r'\bdef\b\s*(\w+)', 1, cls.styles['defclass']),
             # 'class' followed by an identifier
-            (r'\bclass\b\s*(\w+)', 1, self.styles['defclass']),
+            (r'\bclass\b\s*(\w+)', 1, cls.styles['defclass']),
 
             # From '#' until a newline
-            (r'#[^\n]*', 0, self.styles['comment']),
+            (r'#[^\n]*', 0, cls.styles['comment']),
 
             # Numeric literals
-            (r'\b[+-]?[0-9]+[lL]?\b', 0, self.styles['numbers']),
-            (r'\b[+-]?0[xX][0-9A-Fa-f]+[lL]?\b', 0, self.styles['numbers']),
+            (r'\b[+-]?[0-9]+[lL]?\b', 0, cls.styles['numbers']),
+            (r'\b[+-]?0[xX][0-9A-Fa-f]+[lL]?\b', 0, cls.styles['numbers']),
             (r'\b[+-]?[0-9]+(?:\.[0-9]+)?(?:[eE][+-]?[0-9]+)?\b', 0,
-             self.styles['numbers']),
+             cls.styles['numbers']),
         ]
 
-        # Build a QRegExp for each pattern
-        self.rules = [(QtCore.QRegExp(pat), index, fmt)
-                      for (pat, index, fmt) in rules]
+        # Compile each pattern
+        cls._compiled_rules = [(re.compile(pat), index, fmt)
+                               for (pat, index, fmt) in rules]
+
+        return cls._compiled_rules
+
+    def __init__(self, document):
+        super().__init__(document)
+
+        # Multi-line strings (expression, flag, style)
+        # FIXME: The triple-quotes in these two lines will mess up
+        # the syntax highlighting from this point onward
+        self.tri_single = (re.compile("'''"), 1, self.styles['string2'])
+        self.tri_double = (re.compile('"""'), 2, self.styles['string2'])
+
+        self.rules = self._compileRules()
+        self._utf16_offsets = None
+
+    def _setFormat(self, start, length, format):
+        # Convert from code points to the UTF-16 offsets used by Qt.
+        offsets = self._utf16_offsets
+
+        if offsets is not None:
+            # Spans may reach past the end of the block.
+            end = offsets[min(start + length, len(offsets) - 1)]
+            start = offsets[start]
+            length = end - start
+
+        self.setFormat(start, length, format)
 
     def highlightBlock(self, text):
         """Apply syntax highlighting to the given block of text.
         """
+        # The offsets of re only match those of Qt as long as there are
+        # no characters outside the BMP taking two UTF-16 code units.
+        if max(text, default='\0') > '\uffff':
+            self._utf16_offsets = [0]
+
+            for c in text:
+                self._utf16_offsets.append(self._utf16_offsets[-1] +
+                                           (2 if c > '\uffff' else 1))
+
+            setFormat = self._setFormat
+        else:
+            self._utf16_offsets = None
+            setFormat = self.setFormat
+
         # Do other syntax formatting
         for expression, nth, format in self.rules:
-            index = expression.indexIn(text, 0)
-
-            while index >= 0:
+            for match in expression.finditer(text):
                 # We actually want the index of the nth match
-                index = expression.pos(nth)
-                length = len(expression.cap(nth))
-                self.setFormat(index, length, format)
-                index = expression.indexIn(text, index + length)
+                index = match.start(nth)
+                setFormat(index, match.end(nth) - index, format)
 
         self.setCurrentBlockState(0)
 
@@ -434,11 +597,11 @@ class PythonHighlighter(QtGui.QSyntaxHighlighter):
     def match_multiline(self, text, delimiter, in_state, style):
         """
         Do highlighting of multi-line strings. ``delimiter`` should
-        be a ``QRegExp`` for triple-single-quotes or triple-double-
-        quotes, and ``in_state`` should be a unique integer to
-        represent the corresponding state changes when inside those
-        strings. Returns True if we're still inside a multi-line
-        string when this function is finished.
+        be a compiled ``re`` pattern for triple-single-quotes or
+        triple-double-quotes, and ``in_state`` should be a unique
+        integer to represent the corresponding state changes when
+        inside those strings. Returns True if we're still inside a
+        multi-line string when this function is finished.
         """
         # If inside triple-single quotes, start at 0
         if self.previousBlockState() == in_state:
@@ -446,26 +609,32 @@ class PythonHighlighter(QtGui.QSyntaxHighlighter):
             add = 0
         # Otherwise, look for the delimiter on this line
         else:
-            start = delimiter.indexIn(text)
-            # Move past this match
-            add = delimiter.matchedLength()
+            match = delimiter.search(text)
+
+            if match is None:
+                start = -1
+            else:
+                start = match.start()
+                # Move past this match
+                add = match.end() - start
 
         # As long as there's a delimiter match on this line...
         while start >= 0:
             # Look for the ending delimiter
-            end = delimiter.indexIn(text, start + add)
+            match = delimiter.search(text, start + add)
             # Ending delimiter on this line?
-            if end >= add:
-                length = end - start + add + delimiter.matchedLength()
+            if match is not None and match.start() >= add:
+                length = match.end() - start + add
                 self.setCurrentBlockState(0)
             # No; multi-line string
             else:
                 self.setCurrentBlockState(in_state)
                 length = len(text) - start + add
             # Apply formatting
-            self.setFormat(start, length, style)
+            self._setFormat(start, length, style)
             # Look for the next match
-            start = delimiter.indexIn(text, start + length)
+            match = delimiter.search(text, start + length)
+            start = -1 if match is None else match.start()
 
         # Return True if still inside a multi-line string, False
         # otherwise
@@ -509,8 +678,11 @@ class ParameterLineEdit(QtWidgets.QLineEdit):
 
     @QtCore.pyqtSlot()
     def _on_returnPressed(self):
+        func = self._function
+        text = self.text()
+
         try:
-            value = self._function(self.text())
+            value = func(text)
         except ValueError:
             pass
         else:
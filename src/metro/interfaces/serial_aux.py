@@ -4,20 +4,42 @@
 # file, You can obtain one at https://mozilla.org/MPL/2.0/.
 
 
+import time
+
 from serial.tools.list_ports import comports
 
 import metro
 
 
 class SerialPortArgument(metro.ComboBoxArgument):
+    # Enumerating the ports may take a while, so the result is reused
+    # by all instances for this many seconds.
+    PORTS_TIMEOUT = 2.0
+
+    _ports = None
+    _ports_time = 0.0
+
     def __init__(self, default=None):
         super().__init__()
 
         self.default = default
 
+    @classmethod
+    def _getPorts(cls):
+        now = time.monotonic()
+
+        if cls._ports is None or now - cls._ports_time > cls.PORTS_TIMEOUT:
+            cls._ports = tuple(port.device for port in comports())
+            cls._ports_time = now
+
+        return cls._ports
+
+    @classmethod
+    def invalidate_cache(cls):
+        cls._ports = None
+
     def dialog_prepare(self, parent, value=None):
         if value is None:
             value = self.default
 
-        return super().dialog_prepare(parent, [port[0] for port in comports()],
-                                      True, value)
+        return super().dialog_prepare(parent, self._getPorts(), True, value)
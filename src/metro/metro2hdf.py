@@ -5,8 +5,12 @@
 
 
 import collections
+import concurrent.futures
 import glob
+import io
+import mmap
 import os
+import re
 import struct
 import sys
 import time
@@ -27,6 +31,8 @@ HptdcDecodedWord = numpy.dtype([('type', 'S2'), ('arg1', '<i1'),
                                 ('arg2', '<i1'), ('arg3', '<i4')], align=True)
 HptdcHit = numpy.dtype([('time', '<i8'), ('channel', '<u1'), ('type', '<u1'),
                         ('bin', '<u2'), ('align', '<i4')])
+HptdcHitOut = numpy.dtype([('time', '<i8'), ('channel', '<u1'),
+                           ('type', '<u1'), ('bin', '<u2')])
 HptdcStepEntry32 = numpy.dtype([('value', 'a32'), ('data_offset', '<i4'),
                                 ('data_size', '<i4')])
 HptdcStepEntry64 = numpy.dtype([('value', 'a32'), ('data_offset', '<i8'),
@@ -43,10 +49,64 @@ HptdcWordDefinitions = {
 }
 
 
+# Any marker within a data region up to and including its newline
+_EXTRA_MARKER_RE = re.compile(r'#[^\n]*\n?')
+
+
 def _bitmask(start, end):
     return ((1 << (start - end)) - 1) << end
 
 
+def _build_hptdc_arg_tables():
+    # Masks and shifts of each argument by the index of a word type in
+    # HptdcWordDefinitions, with unknown words at the last index stored
+    # as a whole in arg3.
+    arg_tables = {}
+
+    for arg_name in ('arg1', 'arg2', 'arg3'):
+        arg_defs = [type_def.get(arg_name, (0, 0))
+                    for type_def in HptdcWordDefinitions.values()]
+        arg_defs.append((32, 0) if arg_name == 'arg3' else (0, 0))
+
+        arg_tables[arg_name] = (
+            numpy.array([_bitmask(*arg_def) for arg_def in arg_defs],
+                        dtype=HptdcRawWord),
+            numpy.array([arg_def[1] for arg_def in arg_defs],
+                        dtype=HptdcRawWord)
+        )
+
+    return arg_tables
+
+
+HptdcWordTypes = numpy.array(list(HptdcWordDefinitions.keys()) + [b'??'])
+HptdcWordTypeTests = [(32 - type_def['type_len'], type_def['type_val'])
+                      for type_def in HptdcWordDefinitions.values()]
+HptdcWordArgTables = _build_hptdc_arg_tables()
+
+
+def _open_sequential(path):
+    # Open a binary file for reading mostly front to back, with a large
+    # buffer and a hint to the OS to read ahead where supported.
+    fp = open(path, 'rb', buffering=1 << 20)
+
+    if hasattr(os, 'posix_fadvise'):
+        os.posix_fadvise(fp.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+
+    return fp
+
+
+def chunked_compress_args(compress_args, shape, dtype, chunk_size=1 << 20):
+    # Add an explicit chunk shape of about chunk_size bytes, only split
+    # along the first axis, to any compression arguments.
+    if not compress_args:
+        return compress_args
+
+    row_size = numpy.dtype(dtype).itemsize * int(numpy.prod(shape[1:]))
+    chunk_rows = max(1, min(shape[0], chunk_size // max(1, row_size)))
+
+    return dict(compress_args, chunks=(chunk_rows,) + tuple(shape[1:]))
+
+
 def parse_run_root(filename):
     root = os.path.basename(filename)
     parts = root.split('_')
@@ -75,28 +135,75 @@ def parse_run_root(filename):
 
 
 def remove_extra_marker(data_str):
-    while '#' in data_str:
-        marker_start = data_str.find('#')
-        marker_end = (marker_start + data_str[marker_start:].find('\n'))
-        data_str = (data_str[:marker_start] +
-                    data_str[marker_end+1:])
+    data_str, marker_count = _EXTRA_MARKER_RE.subn('', data_str)
 
+    if marker_count > 0:
         print('removed extra marker...', end='', flush=True)
 
     return data_str
 
 
+def find_marker_lines(buf, prefix, start=0):
+    # Start and end offsets of all lines in buf beginning with prefix,
+    # searched for as a whole rather than line by line.
+    offsets = []
+
+    if buf[start:start+len(prefix)] == prefix:
+        offsets.append(start)
+
+    needle = b'\n' + prefix
+    pos = buf.find(needle, start)
+
+    while pos > -1:
+        offsets.append(pos + 1)
+        pos = buf.find(needle, pos + 1)
+
+    # Each line ends after its newline or with buf.
+    return [(offset, buf.find(b'\n', offset) + 1 or len(buf))
+            for offset in offsets]
+
+
+def parse_ascii_rows(data_str, column_count):
+    # Parse whitespace separated values into rows of column_count.
+    # An unterminated last line may have been cut off by an aborted or
+    # still running measurement, so only complete lines are parsed.
+    data_str = data_str[:data_str.rfind('\n') + 1]
+
+    if not data_str.strip():
+        return numpy.zeros((0, column_count))
+
+    return numpy.loadtxt(io.StringIO(data_str), ndmin=2).reshape(
+        -1, column_count
+    )
+
+
 def convert_ascii_file(channel_file, h5ch, compress_args={}, **kwargs):
-    with open(channel_file, 'r') as fp:
+    with open(channel_file, 'rb') as fp:
+        if os.fstat(fp.fileno()).st_size == 0:
+            print('WARNING: Empty file, skipping!')
+            return False
+
+        # The mapping stays valid after the file is closed.
+        mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+    with mm:
+        file_len = len(mm)
         body_offset = 0
         headers = {}
         column_count = 0
         scan_markers = True
 
-        for line in fp:
-            if line[:6] == '# SCAN':
+        # Only the header lines are decoded and parsed one by one.
+        line_end = 0
+
+        while line_end < file_len:
+            line_start = line_end
+            line_end = mm.find(b'\n', line_start) + 1 or file_len
+            line = mm[line_start:line_end].decode()
+
+            if line.startswith('# SCAN'):
                 break
-            elif line[:6] == '# STEP':
+            elif line.startswith('# STEP'):
                 # STEP marker but no SCAN marker
                 print('WARNING: It appears this channel file contains no scan '
                       'markers, assuming one scan...', end='', flush=True)
@@ -167,83 +274,72 @@ def convert_ascii_file(channel_file, h5ch, compress_args={}, **kwargs):
                 return False
 
         # Obtain the column count
-        for line in fp:
-            if line[0] != '#':
-                column_count = len(line.rstrip().split('\t'))
+        while line_end < file_len:
+            line_start = line_end
+            line_end = mm.find(b'\n', line_start) + 1 or file_len
+
+            if mm[line_start:line_start+1] != b'#':
+                column_count = len(
+                    mm[line_start:line_end].rstrip().split(b'\t')
+                )
                 break
 
-        for key, value in headers.items():
-            h5ch.attrs[key] = value
+        h5ch.attrs.update(headers)
 
         # Obtain the number of scans and steps per scan
+        step_lines = find_marker_lines(mm, b'# STEP', body_offset)
+
         if scan_markers:
-            scan_offsets = []
-            step_offsets = []
-            scan_idx = -1
+            scan_lines = find_marker_lines(mm, b'# SCAN', body_offset)
         else:
-            step_offsets = [[]]
-            scan_idx = 0
-
-        cur_offset = body_offset
-        fp.seek(body_offset)
-
-        for line in fp:
-            if line[:6] == '# SCAN':
-                scan_idx += 1
-
-                scan_offsets.append(cur_offset)
-                step_offsets.append([])
-
-            elif line[:6] == '# STEP':
-                step_offsets[scan_idx].append(cur_offset)
-
-            cur_offset += len(line)
-
-        if not scan_markers:
-            scan_offsets = [body_offset]
+            scan_lines = [(body_offset, body_offset)]
 
         if freq == 'step' and shape == 0:
-            for scan_idx in range(len(scan_offsets)):
-                fp.seek(scan_offsets[scan_idx])
-
-                marker_line = fp.readline() if scan_markers else ''
+            for scan_idx in range(len(scan_lines)):
+                data_start = scan_lines[scan_idx][1]
 
                 try:
-                    read_len = (scan_offsets[scan_idx+1] -
-                                scan_offsets[scan_idx] - len(marker_line))
+                    data_end = scan_lines[scan_idx+1][0]
                 except IndexError:
-                    read_len = None
+                    data_end = file_len
 
-                data_str = remove_extra_marker(fp.read(read_len))
+                data_str = remove_extra_marker(
+                    mm[data_start:data_end].decode()
+                )
 
-                h5ch.create_dataset(str(scan_idx), data=numpy.fromstring(
-                    data_str, count=data_str.count('\n'), sep='\n',
-                ))
+                h5ch.create_dataset(str(scan_idx),
+                                    data=parse_ascii_rows(data_str, 1)[:, 0])
 
         else:
-            for scan_idx in range(len(step_offsets)):
+            step_idx = 0
+
+            for scan_idx in range(len(scan_lines)):
                 h5scan = h5ch.create_group(str(scan_idx))
 
-                for step_idx in range(len(step_offsets[scan_idx])):
-                    cur_pos = step_offsets[scan_idx][step_idx]
+                try:
+                    next_scan = scan_lines[scan_idx+1][0]
+                except IndexError:
+                    next_scan = file_len
+
+                # The data of the last step in a scan runs up to the
+                # first step of the next scan, the markers in between
+                # are removed.
+                while (step_idx < len(step_lines) and
+                       step_lines[step_idx][0] < next_scan):
+                    marker_start, marker_end = step_lines[step_idx]
+                    step_idx += 1
 
-                    fp.seek(cur_pos)
-                    marker_line = fp.readline()
+                    marker_line = mm[marker_start:marker_end].decode()
                     step_value = marker_line[marker_line.find(':')+1:].strip()
 
                     try:
-                        read_len = (step_offsets[scan_idx][step_idx+1] -
-                                    cur_pos - len(marker_line))
+                        data_end = step_lines[step_idx][0]
                     except IndexError:
-                        if scan_idx == len(step_offsets)-1:
-                            # This the very last step
-                            read_len = None
-                        else:
-                            # There is a scan ahead
-                            read_len = (step_offsets[scan_idx+1][0] -
-                                        cur_pos - len(marker_line))
+                        data_end = file_len
 
-                    data_str = remove_extra_marker(fp.read(read_len))
+                    data_str = remove_extra_marker(
+                        mm[marker_end:data_end].decode()
+                    )
                     data_len = len(data_str)
 
                     if data_len > 0:
@@ -252,16 +348,15 @@ def convert_ascii_file(channel_file, h5ch, compress_args={}, **kwargs):
                                                else {})
 
                         try:
-                            data = numpy.fromstring(
-                                data_str, sep=' ',
-                                count=data_str.count('\n')*column_count
-                            ).reshape(-1, column_count)
+                            data = parse_ascii_rows(data_str, column_count)
                         except ValueError:
                             pass
                         else:
-                            h5scan.create_dataset(step_value.strip(),
-                                                  data=data,
-                                                  **local_compress_args)
+                            h5scan.create_dataset(
+                                step_value.strip(), data=data,
+                                **chunked_compress_args(local_compress_args,
+                                                        data.shape, data.dtype)
+                            )
                     else:
                         h5scan.create_dataset(step_value.strip(),
                                               shape=(0, column_count))
@@ -270,17 +365,13 @@ def convert_ascii_file(channel_file, h5ch, compress_args={}, **kwargs):
 
 
 def convert_hdf_file(channel_file, h5ch, compress_args={}, **kwargs):
-    # Check first whether we can open the file. We still want to use a
-    # resource manager later on, so we close it immediately
     try:
         h5in = h5py.File(channel_file, 'r')
     except Exception as e:
         print('WARNING: {0}, skipping!'.format(str(e)))
         return False
-    else:
-        h5in.close()
 
-    with h5py.File(channel_file, 'r') as h5in:
+    with h5in:
         try:
             freq = h5in.attrs['freq']
         except KeyError:
@@ -293,8 +384,7 @@ def convert_hdf_file(channel_file, h5ch, compress_args={}, **kwargs):
             print('INFO: Part of a continuous multi-file channel, skipping!')
             return False
 
-        for key in h5in.attrs:
-            h5ch.attrs[key] = h5in.attrs[key]
+        h5ch.attrs.update(h5in.attrs.items())
 
         for k in h5in:
             # Scan groups may be missing, so create them now.
@@ -308,8 +398,8 @@ def convert_hdf_file(channel_file, h5ch, compress_args={}, **kwargs):
     return True
 
 
-def rebuild_hptdc_tables(fp, scan_marker, step_marker, data_end, read_length,
-                         HptdcStepEntry=HptdcStepEntry64):
+def rebuild_hptdc_tables(mm, scan_marker, step_marker, data_end, read_length,
+                         HptdcStepEntry=HptdcStepEntry64, item_size=None):
 
     print('scanning for markers...', end='')
 
@@ -318,159 +408,122 @@ def rebuild_hptdc_tables(fp, scan_marker, step_marker, data_end, read_length,
     # we skip the magic code and search for this marker in the
     # two kiB of the file.
 
-    fp.seek(5)
-    buf = fp.read(2048)
-
-    data_begin = -1
-    scan_marker_length = len(scan_marker)
-
-    for i in range(2048 - scan_marker_length):
-        if buf[i:i+scan_marker_length] == scan_marker:
-            data_begin = 5 + i
-            break
+    data_begin = mm.find(scan_marker, 5, 5 + 2048)
 
     if data_begin < 0:
         print('WARNING: Could not find first scan marker, skipping!')
         return False
 
-    fp.seek(data_begin)
-
-    eof = False
-    buf = b''
-
-    offset = fp.tell()
-    marker_pos = []
-
-    # The outer loop reads a chunk of our file, while the inner
-    # loop searches for markers.
-
-    while not eof:
-        new_buf = fp.read(read_length)
-
-        if len(new_buf) < read_length:
-            eof = True
-
-        buf += new_buf
-
-        buf_len = len(buf)
-        buf_pos = 0
-
-        while buf_pos < buf_len:
-            next_scan_pos = buf[buf_pos:].find(scan_marker)
-            next_step_pos = buf[buf_pos:].find(step_marker)
-
-            if next_scan_pos < 0 and next_step_pos < 0:
-                # Nothing anymore in this block, truncate to the
-                # last checked position or the length of a
-                # marker
-
-                margin_pos = max(
-                    buf_pos,
-                    len(buf) - max(len(scan_marker), len(step_marker))
+    # Both markers consist of two words of half their length, which
+    # are compared against the data viewed as such words. Markers may
+    # only begin at an item boundary, which is every word for 4 byte
+    # group words and every other word for 16 byte hits.
+    word_len = len(scan_marker) // 2
+    word_dtype = numpy.dtype('<u{0}'.format(word_len))
+    word_stride = max(1, (item_size or word_len) // word_len)
+
+    scan_words = numpy.frombuffer(scan_marker, dtype=word_dtype)
+    step_words = numpy.frombuffer(step_marker, dtype=word_dtype)
+
+    chunk_len = max(1, read_length // (word_len * word_stride)) * word_stride
+    scan_pos = []
+    step_pos = []
+
+    data_end = min(data_end, len(mm))
+
+    words = numpy.frombuffer(mm, dtype=word_dtype, offset=data_begin,
+                             count=(data_end - data_begin) // word_len)
+
+    # The data is compared chunk by chunk to limit the size of the
+    # temporary arrays, which only ever look one word ahead.
+    for start in range(0, len(words) - 1, chunk_len):
+        first = words[start:start+chunk_len:word_stride]
+        second = words[start+1:start+chunk_len+1:word_stride]
+        first = first[:len(second)]
+
+        for marker_words, positions in ((scan_words, scan_pos),
+                                        (step_words, step_pos)):
+            idx = numpy.flatnonzero((first == marker_words[0]) &
+                                    (second == marker_words[1]))
+
+            if len(idx) > 0:
+                positions.append(
+                    data_begin + (start + idx * word_stride) * word_len
                 )
-                buf = buf[margin_pos:]
-                offset += margin_pos
 
-                break
-
-            if next_scan_pos > -1:
-                if next_scan_pos < next_step_pos or next_step_pos < 0:
-                    marker_pos.append(offset + buf_pos + next_scan_pos)
-                    marker_pos[-1] = -marker_pos[-1]
-                    buf_pos += next_scan_pos + len(scan_marker)
+    scan_pos = numpy.concatenate(scan_pos or [[]]).astype(numpy.int64)
+    step_pos = numpy.concatenate(step_pos or [[]]).astype(numpy.int64)
 
-            if next_step_pos > -1:
-                if next_step_pos < next_scan_pos or next_scan_pos < 0:
-                    marker_pos.append(offset + buf_pos + next_step_pos)
-                    buf_pos += next_step_pos + len(step_marker)
+    # Each step lasts until the next marker of either kind.
+    marker_pos = numpy.sort(numpy.concatenate((scan_pos, step_pos)))
+    marker_end = numpy.append(marker_pos[1:], data_end)
+    step_end = marker_end[numpy.searchsorted(marker_pos, step_pos)]
 
-    n_markers = len(marker_pos)
-    scan_idx = -1
-    step_idx = 0
+    # Index of the first step in each scan and past its last one.
+    scan_bounds = numpy.append(numpy.searchsorted(step_pos, scan_pos),
+                               len(step_pos))
     step_tables = []
 
-    for i in range(n_markers):
-        if marker_pos[i] < 0:
-            scan_idx += 1
-            step_count = 0
-            step_idx = 0
-
-            for j in range(i+1, n_markers):
-                if marker_pos[j] < 0:
-                    break
-
-                step_count += 1
+    for first_step, end_step in zip(scan_bounds[:-1], scan_bounds[1:]):
+        step_table = numpy.zeros((end_step - first_step,),
+                                 dtype=HptdcStepEntry)
 
-            step_tables.append(numpy.zeros((step_count,),
-                                           dtype=HptdcStepEntry))
-
-        else:
-            entry = step_tables[scan_idx][step_idx]
-
-            entry['value'] = str(float(step_idx)).encode('ascii')
-            entry['data_offset'] = marker_pos[i]
-
-            try:
-                next_marker = marker_pos[i+1]
-            except IndexError:
-                next_marker = data_end
+        step_table['value'] = [str(float(step_idx)).encode('ascii')
+                               for step_idx in range(len(step_table))]
+        step_table['data_offset'] = step_pos[first_step:end_step]
+        step_table['data_size'] = (step_end[first_step:end_step] -
+                                   step_pos[first_step:end_step])
 
-            entry['data_size'] = next_marker - entry['data_offset']
+        step_tables.append(step_table)
 
-            step_idx += 1
-
-    return scan_idx + 1, step_tables
-
-
-def convert_hptdc_group_data_raw(data):
-    return data
+    return len(step_tables), step_tables
 
 
 def convert_hptdc_group_data_decoded(inp):
     outp = numpy.zeros_like(inp, dtype=HptdcDecodedWord)
-    known_mask = numpy.zeros_like(inp, dtype=bool)
-
-    for type_str, type_def in HptdcWordDefinitions.items():
-        type_mask = numpy.equal(inp >> (32 - type_def['type_len']),
-                                type_def['type_val'])
-
-        if not type_mask.any():
-            continue
 
-        known_mask |= type_mask
+    # Each word is assigned the index of its type first, with unknown
+    # words at the last index. The arguments are then extracted for
+    # all words at once with the masks and shifts of their types.
+    type_idx = numpy.full(inp.shape, len(HptdcWordTypes) - 1,
+                          dtype=numpy.intp)
 
-        numpy.place(outp[:]['type'], type_mask, type_str)
+    for type_pos, (type_shift, type_val) in enumerate(HptdcWordTypeTests):
+        type_idx[numpy.equal(inp >> type_shift, type_val)] = type_pos
 
-        for arg_name in ('arg1', 'arg2', 'arg3'):
-            if arg_name not in type_def:
-                continue
+    outp['type'] = HptdcWordTypes[type_idx]
 
-            arg_def = type_def[arg_name]
+    for arg_name, (arg_masks, arg_shifts) in HptdcWordArgTables.items():
+        outp[arg_name] = ((inp & arg_masks[type_idx]) >>
+                          arg_shifts[type_idx])
 
-            numpy.place(outp[:][arg_name], type_mask, (
-                (inp[type_mask] & _bitmask(*arg_def)) >> arg_def[1]
-            ).astype(HptdcDecodedWord.fields[arg_name][0]))
-
-    unknown_mask = ~known_mask
+    return outp
 
-    if unknown_mask.any():
-        numpy.place(outp[:]['type'], unknown_mask, b'??')
-        numpy.place(outp[:]['arg3'], unknown_mask,
-                    inp[unknown_mask].astype('i4'))
 
-    return outp
+def write_hptdc_step_data(h5step, mm, data_offset, data_count, in_dtype,
+                          convert_data_func, chunk_count):
+    # The views on the mapping only live as long as this call.
+    for start_idx in range(0, data_count, chunk_count):
+        data = numpy.frombuffer(
+            mm, dtype=in_dtype, count=min(chunk_count, data_count - start_idx),
+            offset=data_offset + start_idx * in_dtype.itemsize
+        )
 
+        if convert_data_func is not None:
+            data = convert_data_func(data)
 
-def convert_hptdc_hits_data(data):
-    return data[['time', 'channel', 'type', 'bin']]
+        # Written straight from the mapped file if possible.
+        h5step.write_direct(data, dest_sel=numpy.s_[
+            start_idx:start_idx+data.shape[0]
+        ])
 
 
 def convert_hptdc_file(channel_file, h5ch, compress_args={},
-                       hptdc_chunk_size=10000, hptdc_word_format='raw',
+                       hptdc_chunk_size=1000000, hptdc_word_format='raw',
                        hptdc_ignore_tables=False, **kwargs):
     h5ch.attrs['Type'] = 'hptdc'
 
-    with open(channel_file, 'rb') as fp:
+    with _open_sequential(channel_file) as fp:
         # First check for the magic code
         if fp.read(5) != b'HPTDC':
             print('WARNING: Invalid magic code, skipping!')
@@ -515,7 +568,7 @@ def convert_hptdc_file(channel_file, h5ch, compress_args={},
         if mode == b'GRPS':
             if hptdc_word_format == 'raw':
                 out_dtype = HptdcRawWord
-                convert_data_func = convert_hptdc_group_data_raw
+                convert_data_func = None
             elif hptdc_word_format == 'decoded':
                 out_dtype = HptdcDecodedWord
                 convert_data_func = convert_hptdc_group_data_decoded
@@ -525,9 +578,11 @@ def convert_hptdc_file(channel_file, h5ch, compress_args={},
             step_marker = b'\x00\x00\x00\x00\xB0\x00\x00\x00'
 
         elif mode == b'HITS':
-            convert_data_func = convert_hptdc_hits_data
+            # The alignment padding is dropped by HDF5 when writing into
+            # the packed output type, no conversion is needed.
+            convert_data_func = None
             in_dtype = HptdcHit
-            out_dtype = HptdcHit
+            out_dtype = HptdcHitOut
             scan_marker = b'\xFF\xFF\xFF\xFF\xFF\xFF\xFF\xFF\xFF\xA0\x00\x00' \
                           b'\x00\x00\x00\x00'
             step_marker = b'\xFF\xFF\xFF\xFF\xFF\xFF\xFF\xFF\xFF\xB0\x00\x00' \
@@ -547,7 +602,7 @@ def convert_hptdc_file(channel_file, h5ch, compress_args={},
             for scan_idx in range(scan_count):
                 step_count, step_table_size = struct.unpack('<ii', fp.read(8))
 
-                step_table = numpy.fromstring(fp.read(step_table_size),
+                step_table = numpy.frombuffer(fp.read(step_table_size),
                                               dtype=HptdcStepEntry)
 
                 for step_idx in range(step_count):
@@ -573,74 +628,77 @@ def convert_hptdc_file(channel_file, h5ch, compress_args={},
                 print('WARNING: Tables are probably corrupted, trying to '
                       'rebuild...', end='')
 
-        if step_tables is None:
-            # If the scan_table_offset is zero, the file was not closed
-            # properly (at which point the offset is written), so the
-            # data continues until the end. We can therefore use the
-            # total file size as an effective scan_table_offset
-
-            if scan_table_offset == 0:
-                scan_table_offset = os.path.getsize(channel_file)
-
-            scan_count, step_tables = rebuild_hptdc_tables(
-                fp, scan_marker, step_marker, scan_table_offset,
-                max(len(scan_marker), len(step_marker)) * hptdc_chunk_size,
-                HptdcStepEntry
-            )
-
-        for scan_idx in range(scan_count):
-            h5scan = h5ch.create_group(str(scan_idx))
-
-            for step_idx in range(step_tables[scan_idx].shape[0]):
-                step_entry = step_tables[scan_idx][step_idx]
+        # The data itself is only read through the mapping, which must
+        # not be referenced by any array anymore when it is closed.
+        with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if step_tables is None:
+                # If the scan_table_offset is zero, the file was not
+                # closed properly (at which point the offset is written),
+                # so the data continues until the end. We can therefore
+                # use the total file size as an effective
+                # scan_table_offset
+
+                if scan_table_offset == 0:
+                    scan_table_offset = os.path.getsize(channel_file)
+
+                rebuilt_tables = rebuild_hptdc_tables(
+                    mm, scan_marker, step_marker, scan_table_offset,
+                    max(len(scan_marker), len(step_marker)) * hptdc_chunk_size,
+                    HptdcStepEntry, in_dtype.itemsize
+                )
 
-                try:
-                    step_value = step_entry['value'].decode('ascii')
-                except ValueError:
-                    print('WARNING: Corrupted step table, skipping!')
+                if not rebuilt_tables:
                     return False
 
-                fp.seek(step_entry['data_offset'])
-                fp.read(len(step_marker))  # marker
+                scan_count, step_tables = rebuilt_tables
 
-                data_len = step_entry['data_size'] - len(step_marker)
+            for scan_idx in range(scan_count):
+                h5scan = h5ch.create_group(str(scan_idx))
 
-                if data_len < 0:
-                    print('WARNING: Corrupted step table, skipping!')
-                    return False
+                for step_idx in range(step_tables[scan_idx].shape[0]):
+                    step_entry = step_tables[scan_idx][step_idx]
 
-                elif data_len == 0:
                     try:
-                        column_count = len(out_dtype.names)
-                    except TypeError:
-                        column_count = 1
+                        step_value = step_entry['value'].decode('ascii')
+                    except ValueError:
+                        print('WARNING: Corrupted step table, skipping!')
+                        return False
 
-                    h5scan.create_dataset(step_value, shape=(0, column_count),
-                                          dtype=out_dtype)
-                    continue
+                    data_offset = step_entry['data_offset'] + len(step_marker)
+                    data_len = step_entry['data_size'] - len(step_marker)
 
-                elif data_len < 1024:
-                    local_compress_args = {}
+                    if data_len < 0:
+                        print('WARNING: Corrupted step table, skipping!')
+                        return False
 
-                else:
-                    local_compress_args = compress_args
+                    elif data_len == 0:
+                        try:
+                            column_count = len(out_dtype.names)
+                        except TypeError:
+                            column_count = 1
 
-                h5step = h5scan.create_dataset(
-                    step_value, shape=(data_len // in_dtype.itemsize,),
-                    dtype=out_dtype, **local_compress_args
-                )
+                        h5scan.create_dataset(step_value,
+                                              shape=(0, column_count),
+                                              dtype=out_dtype)
+                        continue
+
+                    elif data_len < 1024:
+                        local_compress_args = {}
 
-                chunk_len = int(in_dtype.itemsize * hptdc_chunk_size)
-                start_idx = 0
+                    else:
+                        local_compress_args = compress_args
+
+                    data_count = data_len // in_dtype.itemsize
 
-                for offset in range(0, data_len, chunk_len):
-                    data = convert_data_func(numpy.fromstring(
-                        fp.read(min(chunk_len, data_len - offset)),
-                        dtype=in_dtype
-                    ))
+                    h5step = h5scan.create_dataset(
+                        step_value, shape=(data_count,), dtype=out_dtype,
+                        **chunked_compress_args(local_compress_args,
+                                                (data_count,), out_dtype)
+                    )
 
-                    h5step[start_idx:start_idx+data.shape[0]] = data
-                    start_idx += data.shape[0]
+                    write_hptdc_step_data(h5step, mm, data_offset, data_count,
+                                          in_dtype, convert_data_func,
+                                          int(hptdc_chunk_size))
 
         try:
             fp.seek(param_table_offset)
@@ -674,64 +732,39 @@ def convert_legacy_hptdc_file(channel_file, h5ch, compress_args={}, **kwargs):
 
     h5ch.attrs['Type'] = 'hptdc_legacy'
 
-    with open(channel_file, 'rb') as fp:
-        while True:
-            c = fp.read(1)
-            body_offset += 1
-
-            if c[0] == 0xA:
-                break
-
-        marker = [body_offset-16]
-        cur_offset = body_offset
-
-        fp.seek(cur_offset)
-
-        while True:
-            hit = fp.read(16)
+    with _open_sequential(channel_file) as fp:
+        body_offset += len(fp.readline())
 
-            if not hit:
-                break
-
-            if hit[9] == 3 and hit[:8] == b'\xFF\xFF\xFF\xFF\xFF\xFF\xFF\xFF':
-                marker.append(cur_offset)
-
-            cur_offset += 16
-
-        n_steps = len(marker)-1
-
-        for step_idx in range(n_steps):
-            fp.seek(marker[step_idx])
-            fp.read(16)
-
-            try:
-                read_len = marker[step_idx+1] - marker[step_idx] - 16
-            except IndexError:
-                # Shouldn't happen!
-                break
-
-            data_str = fp.read(read_len)
-            data_len = len(data_str)
-
-            if data_len % 16 != 0:
-                print('WARNING: Invalid data string length {0} on step '
-                      '{1}, skipping!'.format(step_idx, data_len))
-                return False
-
-            if data_len > 0:
-                local_compress_args = (compress_args
-                                       if data_len > 1024
-                                       else {})
-
-                data = numpy.fromstring(data_str, dtype=HptdcHit,
-                                        count=(data_len // 16))
-                h5ch.create_dataset(
-                    str(step_idx),
-                    data=data[['time', 'channel', 'type', 'bin']],
-                    **local_compress_args
-                )
-            else:
-                h5ch.create_dataset(str(step_idx), shape=(0, 4))
+        fp.seek(body_offset)
+        data_str = fp.read()
+
+    n_hits = len(data_str) // 16
+    hits = numpy.frombuffer(data_str, dtype=HptdcHit, count=n_hits)
+
+    # Step markers are hits of type 3 with all bits of time set, find
+    # them in a single pass over the raw bytes.
+    raw = numpy.frombuffer(data_str, dtype=numpy.uint8,
+                           count=n_hits*16).reshape(-1, 16)
+    marker = numpy.flatnonzero((raw[:, 9] == 3) &
+                               (raw[:, :8] == 0xFF).all(axis=1))
+
+    # Each step ends at a marker and begins after the previous one.
+    step_starts = numpy.concatenate(([0], marker[:-1] + 1))
+
+    for step_idx, (start, end) in enumerate(zip(step_starts, marker)):
+        if end > start:
+            local_compress_args = (compress_args
+                                   if (end - start) * 16 > 1024
+                                   else {})
+
+            data = hits[start:end][['time', 'channel', 'type', 'bin']]
+            h5ch.create_dataset(
+                str(step_idx), data=data,
+                **chunked_compress_args(local_compress_args,
+                                        data.shape, data.dtype)
+            )
+        else:
+            h5ch.create_dataset(str(step_idx), shape=(0, 4))
 
     return True
 
@@ -767,40 +800,86 @@ def convert_file(channel_name, channel_file, h5f, compress_args={}, **kwargs):
         print('WARNING: Unknown file format, skipping!')
 
 
+def convert_run(run, output_dir, output_format='{root}', driver=None,
+                libver='latest', compress_args={}, replace=False, **kwargs):
+    if isinstance(compress_args.get('compression'), int):
+        # Filters of hdf5plugin are identified by number and registered
+        # when it is imported, which processes started by spawn instead
+        # of fork have not done yet.
+        import hdf5plugin  # noqa: F401
+
+    print('Starting {0} with {1} channels'.format(run.root,
+                                                  len(run.channels)))
+    start_time = time.time()
+
+    out_path = '{0}/{1}.h5'.format(output_dir,
+                                   output_format.format(**run._asdict()))
+
+    if os.path.isfile(out_path) and not replace:
+        print('Found existing file, skipping!')
+        return
+
+    if libver == 'earliest':
+        file_args = {}
+    else:
+        # Paged file space and a page buffer to collect the many small
+        # metadata writes, which requires at least HDF5 1.10 to read.
+        file_args = dict(fs_strategy='page', fs_page_size=1 << 20,
+                         page_buf_size=16 << 20)
+
+    # A larger chunk cache than the default 1 MiB to hold at least a
+    # complete chunk while it is filled.
+    h5f = h5py.File(out_path, 'w', driver=driver, libver=libver,
+                    rdcc_nbytes=16 << 20, rdcc_nslots=10007, **file_args)
+
+    h5f.attrs.update(number=run.number, name=run.name, root=run.root,
+                     path=run.path, time=run.time, date=run.date)
+
+    for channel_file in run.channels:
+        convert_file(channel_file[len(run.path)+1:channel_file.rfind('.')],
+                     channel_file, h5f, compress_args, **kwargs)
+
+    h5f.close()
+
+    end_time = time.time()
+    print('Completed in {0:.1f} s'.format(end_time - start_time))
+
+
 def run(glob_str='*', output_dir=None, output_format='{root}', driver=None,
-        compress_args={}, replace=False, **kwargs):
+        libver='latest', compress_args={}, replace=False, jobs=1, **kwargs):
     if output_dir is None:
         output_dir = os.getcwd()
 
-    runs = []
-    glob_list = glob.glob(glob_str)
+    runs = {}
+    channel_files = []
 
     # First we sort out the screenshot as markers
-    for entry in glob_list:
-        if entry[-4:] != '.jpg' and entry[-4:] != '.png':
-            continue
+    for entry in glob.glob(glob_str):
+        if entry.endswith(('.jpg', '.png')):
+            run = parse_run_root(entry[:-4])
+            runs[run.path] = run
+        else:
+            channel_files.append(entry)
 
-        runs.append(parse_run_root(entry[:-4]))
+    # Now add the channels, whose files are named by the run path and
+    # the channel name separated by an underscore.
+    for entry in channel_files:
+        sep_pos = entry.find('_')
 
-    # Now add the channels
-    for entry in glob_list:
-        if entry[-4:] == '.jpg' or entry[-4:] == '.png':
-            continue
+        while sep_pos > -1:
+            try:
+                runs[entry[:sep_pos]].channels.append(entry)
+            except KeyError:
+                pass
 
-        for run in runs:
-            if (entry.startswith(run.path) and
-                    entry[:entry.rfind('.')] != run.path):
-                run.channels.append(entry)
+            sep_pos = entry.find('_', sep_pos + 1)
 
     # Filter out runs without any channels
-    filtered_runs = []
-    for run in runs:
-        if len(run.channels) > 0:
-            run.channels.sort()
-            filtered_runs.append(run)
+    for run in runs.values():
+        run.channels.sort()
 
-    runs = sorted(filtered_runs, key=lambda x: x.number)
-    filtered_runs.clear()
+    runs = sorted([run for run in runs.values() if run.channels],
+                  key=lambda x: x.number)
 
     # Fail if we have no channels
     if not runs:
@@ -811,36 +890,22 @@ def run(glob_str='*', output_dir=None, output_format='{root}', driver=None,
         len(runs), sum([len(x.channels) for x in runs])/len(runs)
     ))
 
-    # And let's begin!
-    for run in runs:
-        print('Starting {0} with {1} channels'.format(run.root,
-                                                      len(run.channels)))
-        start_time = time.time()
+    # And let's begin! Each run is written to its own file, so they
+    # can be converted in parallel.
+    if jobs > 1:
+        with concurrent.futures.ProcessPoolExecutor(jobs) as executor:
+            futures = [executor.submit(convert_run, run, output_dir,
+                                       output_format, driver, libver,
+                                       compress_args, replace, **kwargs)
+                       for run in runs]
 
-        out_path = '{0}/{1}.h5'.format(output_dir,
-                                       output_format.format(**run._asdict()))
+            for future in futures:
+                future.result()
 
-        if os.path.isfile(out_path) and not replace:
-            print('Found existing file, skipping!')
-            continue
-
-        h5f = h5py.File(out_path, 'w', driver=driver)
-
-        h5f.attrs['number'] = run.number
-        h5f.attrs['name'] = run.name
-        h5f.attrs['root'] = run.root
-        h5f.attrs['path'] = run.path
-        h5f.attrs['time'] = run.time
-        h5f.attrs['date'] = run.date
-
-        for channel_file in run.channels:
-            convert_file(channel_file[len(run.path)+1:channel_file.rfind('.')],
-                         channel_file, h5f, compress_args, **kwargs)
-
-        h5f.close()
-
-        end_time = time.time()
-        print('Completed in {0:.1f} s'.format(end_time - start_time))
+    else:
+        for run in runs:
+            convert_run(run, output_dir, output_format, driver, libver,
+                        compress_args, replace, **kwargs)
 
 
 # -----------------------------------------------------------------------------
@@ -878,6 +943,13 @@ def main():
         help='give more detailed messages if possible'
     )
 
+    cli.add_argument(
+        '--jobs', dest='jobs', action='store', type=int, metavar='count',
+        default=1,
+        help='the number of measurement runs to convert in parallel, their '
+             'messages may be interleaved (default: 1)'
+    )
+
     shortening_group = cli.add_mutually_exclusive_group()
 
     shortening_group.add_argument(
@@ -899,19 +971,52 @@ def main():
     )
 
     hdf_group.add_argument(
+        '--libver', dest='libver', action='store', type=str,
+        metavar='version', choices=['earliest', 'latest'], default='latest',
+        help='file format version to write, \'earliest\' creates files '
+             'readable by HDF5 before 1.10 with slower metadata writes '
+             '(default: latest)'
+    )
+
+    compression_group = hdf_group.add_mutually_exclusive_group()
+
+    compression_group.add_argument(
         '--compress', dest='compression', action='store', type=int,
-        metavar='level', const=4, default=-1, nargs='?',
-        help='use gzip compression with optionally specified level '
-             '(default: 4) for datasets above 1024 bytes'
+        metavar='level', const=4, default=1, nargs='?',
+        help='compression level for datasets above 1024 bytes ranging from '
+             '0 to 9 for gzip and blosc or up to 22 for zstd, low levels '
+             'are fastest while levels above 6 gain little in size for much '
+             'longer conversion times (default: 1, or 4 without a level)'
+    )
+
+    compression_group.add_argument(
+        '--no-compress', dest='compression', action='store_const',
+        const=None, help='store all datasets without compression'
+    )
+
+    hdf_group.add_argument(
+        '--codec', dest='codec', action='store', type=str,
+        choices=['gzip', 'lzf', 'blosc', 'blosc-zstd', 'lz4', 'zstd'],
+        default='gzip',
+        help='the compression filter to use, lzf and lz4 ignore the level '
+             'and all but gzip and lzf require the hdf5plugin package '
+             '(default: gzip)'
+    )
+
+    hdf_group.add_argument(
+        '--compression-preset', dest='compression_preset', action='store',
+        type=str, choices=['fast', 'balanced', 'archive'],
+        help='use zstd compression with level 3, 12 or 19 for fast, '
+             'balanced or archival storage, overrides --compress and --codec'
     )
 
     hptdc_group = cli.add_argument_group('HPTDC options')
 
     hptdc_group.add_argument(
         '--hptdc-chunk-size', dest='hptdc_chunk_size', action='store',
-        type=int, metavar='size', default=10000,
+        type=int, metavar='size', default=1000000,
         help='the number of data elements to read, convert and store at a '
-             'time (default: 1e5).'
+             'time (default: 1e6).'
     )
 
     hptdc_group.add_argument(
@@ -952,9 +1057,53 @@ def main():
         sys.exit(0)
 
     compress_args = {}
-    if args.compression > -1:
-        compress_args['compression'] = 'gzip'
-        compress_args['compression_opts'] = args.compression
+    if args.compression_preset is not None:
+        args.codec = 'zstd'
+        args.compression = {'fast': 3, 'balanced': 12,
+                            'archive': 19}[args.compression_preset]
+
+    if args.compression is not None:
+        if args.codec == 'gzip' and args.compression > 6:
+            print('WARNING: gzip levels above 6 rarely reduce the size by '
+                  'more than 10% but take several times longer, consider '
+                  'a lower level or the zstd codec')
+
+        if args.codec in ('gzip', 'lzf'):
+            compress_args['compression'] = args.codec
+            compress_args['shuffle'] = True
+
+            if args.codec == 'gzip':
+                compress_args['compression_opts'] = args.compression
+
+        else:
+            try:
+                import hdf5plugin
+            except ImportError:
+                print('FATAL: {0} compression requires the hdf5plugin '
+                      'package'.format(args.codec))
+                sys.exit(0)
+
+            # Blosc applies its own byte or bit shuffle before
+            # compression, the others use the shuffle filter.
+            if args.codec == 'blosc':
+                compress_args.update(hdf5plugin.Blosc(
+                    cname='lz4', clevel=args.compression,
+                    shuffle=hdf5plugin.Blosc.SHUFFLE
+                ))
+
+            elif args.codec == 'blosc-zstd':
+                compress_args.update(hdf5plugin.Blosc(
+                    cname='zstd', clevel=args.compression,
+                    shuffle=hdf5plugin.Blosc.BITSHUFFLE
+                ))
+
+            elif args.codec == 'lz4':
+                compress_args.update(hdf5plugin.LZ4())
+                compress_args['shuffle'] = True
+
+            elif args.codec == 'zstd':
+                compress_args.update(hdf5plugin.Zstd(clevel=args.compression))
+                compress_args['shuffle'] = True
 
     try:
         run(compress_args=compress_args, output_format=output_format,
@@ -0,0 +1,66 @@
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+
+import os
+import tempfile
+import unittest
+
+import h5py
+import numpy
+
+from .. import metro2hdf
+
+
+class TestConvertAsciiFile(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.txt')
+        os.close(fd)
+
+        self.h5f = h5py.File('convert_ascii_file.h5', 'w', driver='core',
+                             backing_store=False)
+
+    def tearDown(self):
+        self.h5f.close()
+        os.remove(self.path)
+
+    def convert(self, content):
+        with open(self.path, 'w') as fp:
+            fp.write(content)
+
+        h5ch = self.h5f.create_group('channel')
+        self.assertTrue(metro2hdf.convert_ascii_file(self.path, h5ch))
+
+        return h5ch
+
+    def test_truncated_step_channel(self):
+        # The last line was cut off in the middle of a value.
+        h5ch = self.convert('# Frequency: step\n# Shape: 0\n'
+                            '# SCAN 0\n# STEP 0: 0.0\n0.5\n# STEP 1: 1.0\n'
+                            '1.5\n# SCAN 1\n# STEP 0: 0.0\n2.5\n0.e')
+
+        self.assertEqual(list(h5ch['0']), [0.5, 1.5])
+        self.assertEqual(list(h5ch['1']), [2.5])
+
+    def test_truncated_continuous_channel(self):
+        # The last row is missing a column and its partial value would
+        # otherwise still parse.
+        h5ch = self.convert('# Frequency: continuous\n# Shape: 2\n'
+                            '# SCAN 0\n# STEP 0: 0.0\n1\t2\n3\t4\n'
+                            '# STEP 1: 1.0\n5\t6\n7\t-0')
+
+        numpy.testing.assert_array_equal(h5ch['0/0.0'], [[1, 2], [3, 4]])
+        numpy.testing.assert_array_equal(h5ch['0/1.0'], [[5, 6]])
+
+        del self.h5f['channel']
+
+        h5ch = self.convert('# Frequency: continuous\n# Shape: 2\n'
+                            '# SCAN 0\n# STEP 0: 0.0\n1\t2\n3')
+
+        numpy.testing.assert_array_equal(h5ch['0/0.0'], [[1, 2]])
+
+
+if __name__ == '__main__':
+    unittest.main()